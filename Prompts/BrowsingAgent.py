@@ -15,4 +15,19 @@ Example response:
   {{"url": "Item Url", "description": "Item Description", "price": "Item Price", "imageUrl: "imageUrl"}},
   {{"url": "Item Url", "description": "Item Description", "price": "Item Price", "imageUrl: "imageUrl"}}
 ]
-"""
\ No newline at end of file
+"""
+
+
+RANK_COMPACT_PROMPT_TEMPLATE = """
+Rank the listings below by relevance to the user's request. Leave out listings that are not relevant.
+
+User's request: {request}
+
+Listings (id | price | description):
+{listings}
+
+Return only a JSON array of listing ids, most relevant first. Do not provide reasoning.
+
+Example response:
+[3, 1, 7]
+"""
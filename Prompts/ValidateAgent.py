@@ -22,18 +22,111 @@ If the item is relevant to the user's requests, come up with a first message to
 
 Example output format:
 [
-  {
+  {{
     "item_id": "url",
     "reasoning": "This item matches the user's description and price range."
     "relevant": 1,
-    "first message": "Hi! Is this still available?"
-  },
-  {
+    "first_message": "Hi! Is this still available?"
+  }},
+  {{
     "item_id": "url",
     "reasoning": 
     "relevant": 0,
-    "first message": "Null"
-  }
+    "first_message": "Null"
+  }}
 ]
 Remember to consider all aspects of the user's request and the item details when making your determination.
-"""
\ No newline at end of file
+"""
+
+
+VALIDATE_COMPACT_PROMPT_TEMPLATE = """
+Decide for each listing whether it fulfills the user's request. Consider whether the description matches the request, whether the price is within the user's goal and whether it meets any specific criteria in the request.
+
+The user's original request:
+{request}
+
+Listings (id | price | listed price | date published | description | message):
+{listings}
+
+Return only a JSON array with one entry per listing: [id, 1] if it is relevant, [id, 0] if it is not.{reasoning}
+
+Example output format:
+{example}
+"""
+
+VALIDATE_COMPACT_REASONING = " Add a short reason (under 15 words) as a third element."
+VALIDATE_COMPACT_EXAMPLE = "[[1, 1], [2, 0]]"
+VALIDATE_COMPACT_REASONING_EXAMPLE = '[[1, 1, "matches the request and price"], [2, 0, "wrong item"]]'
+
+
+VALIDATE_BATCH_PROMPT_TEMPLATE = """
+You are an AI agent tasked with determining whether listings fulfill the criteria of several users' original requests. Each request below is followed by its own listings; judge every listing only against the request it is listed under.
+
+{requests}
+
+Analyze each item and determine if it matches its user's request. Consider factors such as:
+
+Does the item's description match the user's request?
+Is the price within the user's goal?
+Does the item meet any specific criteria mentioned in the request?
+
+For each item, write our your reasoning, return a boolean value, :
+
+1 if the item is relevant to the user's request
+0 if the item is not relevant to the user's request.
+
+If the item is relevant to the user's requests, come up with a first message to the seller. The first message should be brief and concise, while still expressing interest.
+
+Return one entry per listing, with the number of the request it belongs to.
+
+Example output format:
+[
+  {{
+    "request": 1,
+    "item_id": "url",
+    "reasoning": "This item matches the user's description and price range."
+    "relevant": 1,
+    "first_message": "Hi! Is this still available?"
+  }},
+  {{
+    "request": 2,
+    "item_id": "url",
+    "reasoning": 
+    "relevant": 0,
+    "first_message": "Null"
+  }}
+]
+Remember to consider all aspects of each user's request and the item details when making your determination.
+"""
+
+
+VALIDATE_COMPACT_BATCH_PROMPT_TEMPLATE = """
+Decide for each listing whether it fulfills the user request it belongs to. Consider whether the description matches the request, whether the price is within the user's goal and whether it meets any specific criteria in the request.
+
+User requests:
+{requests}
+
+Listings (id | request | price | listed price | date published | description | message):
+{listings}
+
+Return only a JSON array with one entry per listing: [id, 1] if it is relevant to its request, [id, 0] if it is not.{reasoning}
+
+Example output format:
+{example}
+"""
+
+
+VALIDATE_TRIAGE_PROMPT_TEMPLATE = """
+Decide for each listing whether it fulfills the user's request, and how sure you are. Consider whether the description matches the request, whether the price is within the user's goal and whether it meets any specific criteria in the request.
+
+The user's original request:
+{request}
+
+Listings (id | price | listed price | date published | description | message):
+{listings}
+
+Return only a JSON array with one entry per listing: [id, 1, confidence] if it is relevant, [id, 0, confidence] if it is not, where confidence is a number from 0 to 1. Use a low confidence whenever the listing is ambiguous or details are missing.
+
+Example output format:
+[[1, 1, 0.95], [2, 0, 0.99], [3, 1, 0.4]]
+"""
@@ -0,0 +1,125 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+
+import metrics
+
+LOG_FILE = os.getenv("LOG_FILE", "negotiation.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Longer strings in the message or payload are cut to this many characters.
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "4000"))
+# Share of records whose `payload` (listings, completions) is kept.
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def _truncate(value, limit: int = LOG_MAX_FIELD_CHARS):
+    if isinstance(value, str):
+        if len(value) > limit:
+            return f"{value[:limit]}... [{len(value) - limit} chars truncated]"
+        return value
+    if isinstance(value, dict):
+        return {str(k): _truncate(v, limit) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_truncate(v, limit) for v in value]
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    return _truncate(str(value), limit)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; runs on the writer thread."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(
+                record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _truncate(record.getMessage()),
+        }
+        for field in ("request_id", "route"):
+            if getattr(record, field, None) is not None:
+                entry[field] = getattr(record, field)
+        if getattr(record, "payload", None) is not None:
+            entry["payload"] = _truncate(record.payload)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record as-is, tagged with the request context.
+
+    The stock QueueHandler formats the message before enqueueing; here that
+    (and the JSON encoding) is left to the writer thread so the event loop
+    only pays for building the LogRecord.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()
+        route = metrics.current_route.get()
+        record.route = route if route != "none" else None
+        if (getattr(record, "payload", None) is not None
+                and random.random() >= LOG_PAYLOAD_SAMPLE_RATE):
+            record.payload = None
+        return record
+
+
+def setup_logging():
+    """Route the root logger through a queue to a rotating JSON file.
+
+    Does nothing if the root logger already has handlers, like
+    logging.basicConfig.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JSONFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(ContextQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    return listener
+
+
+class RequestIdMiddleware:
+    """Tag each request with an id (X-Request-ID, or a new one) for the logs
+    and echo it back in the response headers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope["headers"]).get(b"x-request-id")
+        rid = header.decode("latin-1")[:64] if header else uuid.uuid4().hex
+        token = request_id.set(rid)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-request-id", rid.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
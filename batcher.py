@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Merge work submitted within a short window into one batch call.
+
+    Submissions are grouped by key (work under different keys can't share a
+    prompt). A group is flushed `window` seconds after its first submission,
+    or as soon as its summed cost reaches `token_budget`.
+    `run_batch(key, payloads)` returns one result per payload, None where it
+    had no answer for that caller. Those callers, and every caller of a batch
+    that raised, fail over to `run_one(key, payload)` on their own, so one
+    bad batch never fails the rest. A lone submission goes straight to
+    run_one.
+    """
+
+    def __init__(self, run_batch, run_one, window: float, token_budget: int):
+        self.run_batch = run_batch
+        self.run_one = run_one
+        self.window = window
+        self.token_budget = token_budget
+        self._groups = {}
+        self.batches = 0
+        self.batched_calls = 0
+        self.solo_calls = 0
+        self.failovers = 0
+
+    async def submit(self, key, payload, cost: int):
+        if self.window <= 0:
+            self.solo_calls += 1
+            return await self.run_one(key, payload)
+
+        group = self._groups.get(key)
+        if group is not None and group["cost"] + cost > self.token_budget:
+            self._flush(key)
+            group = None
+        if group is None:
+            group = self._groups[key] = {"entries": [], "cost": 0}
+            group["timer"] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, key)
+        future = asyncio.get_running_loop().create_future()
+        group["entries"].append((payload, future))
+        group["cost"] += cost
+        if group["cost"] >= self.token_budget:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key):
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        group["timer"].cancel()
+        # Callers that gave up while waiting are left out of the prompt
+        entries = [(payload, future) for payload, future in group["entries"]
+                   if not future.done()]
+        if entries:
+            asyncio.ensure_future(self._run(key, entries))
+
+    async def _run(self, key, entries: list):
+        if len(entries) == 1:
+            self.solo_calls += 1
+            await self._resolve(key, *entries[0])
+            return
+
+        self.batches += 1
+        self.batched_calls += len(entries)
+        try:
+            results = await self.run_batch(key,
+                                           [payload for payload, _ in entries])
+        except Exception as e:
+            logger.warning("Batch of %d failed, failing over: %s",
+                           len(entries), e)
+            results = [None] * len(entries)
+
+        retries = []
+        for (payload, future), result in zip(entries, results):
+            if future.done():
+                continue
+            if result is None:
+                self.failovers += 1
+                retries.append(self._resolve(key, payload, future))
+            else:
+                future.set_result(result)
+        await asyncio.gather(*retries)
+
+    async def _resolve(self, key, payload, future):
+        try:
+            result = await self.run_one(key, payload)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window": self.window,
+            "token_budget": self.token_budget,
+            "batches": self.batches,
+            "batched_calls": self.batched_calls,
+            "solo_calls": self.solo_calls,
+            "failovers": self.failovers,
+        }
@@ -0,0 +1,45 @@
+"""Time structured_output.extract_json on large, messy model outputs.
+
+    python -m benchmarks.bench_structured_output --items 5000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured_output import extract_json  # noqa: E402
+
+
+def model_output(items: int) -> str:
+    listings = [{
+        "url": f"https://www.facebook.com/marketplace/item/{i}",
+        "description": f"Blue couch in great condition, barely used #{i}",
+        "price": 100 + i,
+        "imageUrl": f"https://example.com/{i}.jpg",
+    } for i in range(items)]
+    return ("Here are the relevant listings, ranked:\n```json\n" +
+            json.dumps(listings, indent=2) + "\n```\nLet me know if [you] "
+            "need anything else.")
+
+
+def bench(label: str, text: str, runs: int):
+    start = time.perf_counter()
+    for _ in range(runs):
+        value = extract_json(text, expect=list)
+    elapsed = (time.perf_counter() - start) / runs
+    print(f"{label:<12} {len(text) / 1e6:6.2f} MB  {len(value):6d} items  "
+          f"{elapsed * 1000:8.2f} ms  {len(text) / elapsed / 1e6:7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    text = model_output(args.items)
+    bench("complete", text, args.runs)
+    bench("truncated", text[:len(text) * 2 // 3], args.runs)
@@ -0,0 +1,104 @@
+"""Compare the old per-row POST /viables insert loop with the bulk upsert.
+
+Runs against BENCH_DATABASE_URL (or DATABASE_URL) inside a temporary item
+table, so nothing is written to the real tables:
+
+    python -m benchmarks.bench_viables --rows 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository import upsert_items  # noqa: E402
+
+TEMP_ITEM_TABLE = """
+    CREATE TEMP TABLE item (
+        id serial PRIMARY KEY,
+        description text,
+        searchid integer,
+        url text,
+        image text,
+        message text,
+        itemsearch text,
+        listedprice double precision,
+        estimateprice double precision,
+        minprice double precision,
+        maxprice double precision,
+        datepublished text,
+        UNIQUE (searchid, url)
+    )
+"""
+
+LOOP_INSERT = """
+    INSERT INTO item (description, searchid, url, image, message, itemsearch, listedprice, estimateprice, minprice, maxprice, datepublished)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+    RETURNING id, description, searchid, url, image, message, itemsearch, listedprice, estimateprice, minprice, maxprice, datepublished
+"""
+
+
+def synthetic_items(rows: int, searchid: int = 1) -> list:
+    return [{
+        "description": f"Blue couch in great condition #{i}",
+        "searchid": searchid,
+        "url": f"https://www.facebook.com/marketplace/item/{i}",
+        "image": f"https://example.com/{i}.jpg",
+        "message": "Hi! Is this still available?",
+        "itemsearch": "blue couch",
+        "listedprice": 150.0,
+        "estimateprice": 120.0,
+        "minprice": 50.0,
+        "maxprice": 200.0,
+        "datepublished": "2024-09-14",
+    } for i in range(rows)]
+
+
+async def run_loop(conn, items):
+    for item in items:
+        await conn.fetchrow(LOOP_INSERT, item['description'],
+                            item['searchid'], item['url'], item['image'],
+                            item['message'], item['itemsearch'],
+                            item['listedprice'], item['estimateprice'],
+                            item['minprice'], item['maxprice'],
+                            item['datepublished'])
+
+
+async def timed(label, rows, coro):
+    start = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:8.3f}s  {rows / elapsed:10.0f} rows/s")
+    return elapsed, result
+
+
+async def main(rows: int):
+    database_url = os.getenv("BENCH_DATABASE_URL", os.getenv("DATABASE_URL"))
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute(TEMP_ITEM_TABLE)
+        items = synthetic_items(rows)
+
+        loop_time, _ = await timed("per-row loop", rows,
+                                   run_loop(conn, items))
+        await conn.execute("TRUNCATE item")
+
+        bulk_time, counts = await timed("bulk insert", rows,
+                                        upsert_items(conn, items))
+        print("  ", counts)
+        _, counts = await timed("bulk upsert (update)", rows,
+                                upsert_items(conn, items))
+        print("  ", counts)
+        print(f"speedup: {loop_time / bulk_time:.1f}x")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    asyncio.run(main(parser.parse_args().rows))
@@ -0,0 +1,138 @@
+"""OpenAI/Groq/Together-compatible chat completion server for offline runs.
+
+Answers with plausible JSON for the rank, validate and negotiation prompts
+after a configurable time-to-first-token and token rate:
+
+    python -m benchmarks.fake_llm --port 8100 --ttft 0.3 --tokens-per-second 80
+
+Point the app at it with GROQ_BASE_URL=http://127.0.0.1:8100.
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI()
+app.state.ttft = 0.3
+app.state.tokens_per_second = 80.0
+
+LISTING_ID = re.compile(r"^(\d+) \| ", re.MULTILINE)
+RANK_URL = re.compile(r"^url: (.+)$", re.MULTILINE)
+VALIDATE_URL = re.compile(r"^URL: (.+)$", re.MULTILINE)
+BATCH_REQUEST = re.compile(r"^Request (\d+): ", re.MULTILINE)
+
+
+def batch_verdicts(prompt: str) -> list:
+    verdicts = []
+    sections = BATCH_REQUEST.split(prompt)[1:]
+    for number, section in zip(sections[::2], sections[1::2]):
+        verdicts.extend({
+            "request": int(number),
+            "item_id": url,
+            "reasoning": "The description matches the request.",
+            "relevant": 1,
+            "first_message": "Hi! Is this still available?"
+        } for url in VALIDATE_URL.findall(section))
+    return verdicts
+
+
+def reply_for(prompt: str) -> str:
+    if "Rank the listings below" in prompt:
+        return json.dumps([int(i) for i in LISTING_ID.findall(prompt)])
+    if "several users' original requests" in prompt:
+        return json.dumps(batch_verdicts(prompt))
+    if "Decide for each listing" in prompt:
+        return json.dumps([[int(i), int(i) % 2]
+                           for i in LISTING_ID.findall(prompt)])
+    if "ranked json array" in prompt:
+        return json.dumps([{"url": url} for url in RANK_URL.findall(prompt)])
+    if "determining whether a list of items" in prompt:
+        return json.dumps([{
+            "item_id": url,
+            "reasoning": "The description matches the request.",
+            "relevant": 1,
+            "first_message": "Hi! Is this still available?"
+        } for url in VALIDATE_URL.findall(prompt)])
+    if "negotiation assistant" in prompt:
+        return json.dumps({
+            "role": "assistant",
+            "content": "Would you consider $90 if I pick it up today?",
+            "reasoning": "Opening slightly below the goal leaves room to "
+            "move while staying reasonable."
+        })
+    return "[]"
+
+
+def count_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+@app.post("/openai/v1/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+    content = reply_for(prompt)
+    usage = {
+        "prompt_tokens": count_tokens(prompt),
+        "completion_tokens": count_tokens(content),
+        "total_tokens": count_tokens(prompt) + count_tokens(content),
+    }
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "fake")
+    per_token = 1 / app.state.tokens_per_second
+
+    if not body.get("stream"):
+        await asyncio.sleep(app.state.ttft +
+                            usage["completion_tokens"] * per_token)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    async def events():
+        await asyncio.sleep(app.state.ttft)
+        for i in range(0, len(content), 4):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": content[i:i + 4]},
+                    "finish_reason": None,
+                }],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(per_token)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    args = parser.parse_args()
+    app.state.ttft = args.ttft
+    app.state.tokens_per_second = args.tokens_per_second
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
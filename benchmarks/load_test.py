@@ -0,0 +1,299 @@
+"""Offline load test for the API with a fake LLM and a local Postgres.
+
+Starts benchmarks.fake_llm and main.py as subprocesses, drives concurrent
+load against /rank, /validate, /chat, /searchItems and /viables, and
+reports throughput and p50/p95/p99 latency per endpoint. Each run is saved
+under benchmarks/results/ and compared with the previous one.
+
+The database is BENCH_DATABASE_URL when set (use a scratch database: the
+tables are created and written to), otherwise a throwaway local server
+from the optional `pgserver` package.
+
+    python -m benchmarks.load_test --requests 200 --concurrency 20 --ttft 0.3
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import asyncpg
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+ENDPOINTS = ("rank", "validate", "chat", "searchItems", "viables_post",
+             "viables_get")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+def start_database(workdir: str) -> str:
+    url = os.getenv("BENCH_DATABASE_URL")
+    if url:
+        return url
+    try:
+        import pgserver
+    except ImportError:
+        sys.exit("Set BENCH_DATABASE_URL or `pip install pgserver` for a "
+                 "throwaway local Postgres.")
+    return pgserver.get_server(os.path.join(workdir, "pgdata")).get_uri()
+
+
+async def prepare_database(url: str):
+    conn = await asyncpg.connect(url)
+    try:
+        with open(os.path.join(ROOT, "benchmarks", "schema.sql")) as f:
+            await conn.execute(f.read())
+        migrations = os.path.join(ROOT, "migrations")
+        for name in sorted(os.listdir(migrations)):
+            if name.endswith(".sql"):
+                with open(os.path.join(migrations, name)) as f:
+                    await conn.execute(f.read())
+        return await conn.fetchval(
+            "INSERT INTO item_search (userid, searchitem, minprice, maxprice) "
+            "VALUES ('bench', 'blue couch', 50, 200) RETURNING id")
+    finally:
+        await conn.close()
+
+
+def spawn(args: list, env: dict, cwd: str) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args],
+                            env={**os.environ, **env},
+                            cwd=cwd,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+
+async def wait_until_up(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def listing(i: int, salt: str) -> dict:
+    return {
+        "description": f"Blue couch in great condition, seats three {salt}",
+        "price": 80 + i % 100,
+        "url": f"https://www.facebook.com/marketplace/item/{salt}-{i}",
+        "imageUrl": f"https://example.com/{i}.jpg",
+    }
+
+
+def make_request(endpoint: str, i: int, salt: str, searchid: int):
+    if endpoint == "rank":
+        return "POST", "/rank", {
+            "request": "blue couch",
+            "searchid": searchid,
+            "items": [listing(n, salt) for n in range(20)]
+        }
+    if endpoint == "validate":
+        return "POST", "/validate", {
+            "request": "blue couch",
+            "items": [{
+                **listing(n, salt), "listedprice": 150,
+                "message": "Hi! Is this still available?",
+                "datepublished": "2024-09-14"
+            } for n in range(5)]
+        }
+    if endpoint == "chat":
+        return "POST", "/chat", {
+            "context": f"The seller is selling a couch for $150 {salt}",
+            "item_description": "I want to buy a couch for $100",
+            # Left to the model by the fast path, so /chat times a completion
+            "chat_history": [{
+                "role": "seller",
+                "content": "I could maybe go a bit lower, what's your offer?"
+            }]
+        }
+    if endpoint == "searchItems":
+        return "POST", "/searchItems", {
+            "userid": f"bench-{salt}",
+            "searchitem": "blue couch",
+            "minprice": 50,
+            "maxprice": 200
+        }
+    if endpoint == "viables_post":
+        return "POST", "/viables", {
+            "items": [{
+                "description": "Blue couch",
+                "searchid": searchid,
+                "url": f"https://www.facebook.com/marketplace/item/{salt}-{i}-{n}",
+                "image": "https://example.com/1.jpg",
+                "message": "Hi!",
+                "itemsearch": "blue couch",
+                "listedprice": 150.0,
+                "estimateprice": 120.0,
+                "minprice": 50.0,
+                "maxprice": 200.0,
+                "datepublished": "2024-09-14"
+            } for n in range(10)]
+        }
+    return "GET", f"/viables?id={searchid}", None
+
+
+async def drive(client: httpx.AsyncClient, endpoint: str, requests: int,
+                concurrency: int, repeat_ratio: float, searchid: int) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            # Repeated payloads exercise the caches, unique ones the model
+            salt = ("repeat" if random.random() < repeat_ratio else
+                    f"{endpoint}-{i}-{random.getrandbits(32)}")
+            method, path, body = make_request(endpoint, i, salt, searchid)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / elapsed,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=ROOT,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_results():
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json"))
+    if not files:
+        return None
+    with open(os.path.join(RESULTS_DIR, files[-1])) as f:
+        return json.load(f)
+
+
+def report(results: dict, previous: dict):
+    print(f"{'endpoint':<14}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'p99 ms':>10}{'errors':>8}  vs previous p95")
+    for endpoint, stats in results["endpoints"].items():
+        delta = ""
+        before = (previous or {}).get("endpoints", {}).get(endpoint)
+        if before and before["p95_ms"]:
+            change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+            delta = f"{change:+.0%} ({previous['commit']})"
+        print(f"{endpoint:<14}{stats['throughput_rps']:9.1f}"
+              f"{stats['p50_ms']:10.1f}{stats['p95_ms']:10.1f}"
+              f"{stats['p99_ms']:10.1f}{stats['errors']:8d}  {delta}")
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="bargain-bench-")
+    database_url = start_database(workdir)
+    searchid = await prepare_database(database_url)
+
+    llm_port, app_port = free_port(), free_port()
+    processes = [
+        spawn([
+            "-m", "benchmarks.fake_llm", "--port",
+            str(llm_port), "--ttft",
+            str(args.ttft), "--tokens-per-second",
+            str(args.tokens_per_second)
+        ], {}, ROOT),
+        # Run from a scratch directory so the app's log file lands there
+        spawn([
+            "-m", "uvicorn", "main:app", "--port",
+            str(app_port), "--log-level", "warning"
+        ], {
+            "PYTHONPATH": ROOT,
+            "DATABASE_URL": database_url,
+            "LLM_PROVIDER": "groq",
+            "GROQ_API_KEY": "bench",
+            "GROQ_BASE_URL": f"http://127.0.0.1:{llm_port}",
+        }, workdir),
+    ]
+    try:
+        base_url = f"http://127.0.0.1:{app_port}"
+        await wait_until_up(f"http://127.0.0.1:{llm_port}/docs")
+        await wait_until_up(f"{base_url}/docs")
+
+        results = {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "config": vars(args),
+            "endpoints": {},
+        }
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=base_url,
+                                     timeout=120,
+                                     limits=limits) as client:
+            for endpoint in args.endpoints:
+                results["endpoints"][endpoint] = await drive(
+                    client, endpoint, args.requests, args.concurrency,
+                    args.repeat_ratio, searchid)
+
+        previous = previous_results()
+        report(results, previous)
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{results['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {os.path.relpath(path, ROOT)}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.3,
+                        help="fake LLM time to first token, seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--repeat-ratio", type=float, default=0.0,
+                        help="share of requests reusing one payload")
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS),
+                        choices=ENDPOINTS)
+    asyncio.run(main(parser.parse_args()))
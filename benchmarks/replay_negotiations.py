@@ -0,0 +1,270 @@
+"""Replay negotiation.log transcripts through the /chat path.
+
+Parses the "Context:", "Seller:", "Assistant:" and "AI Response:" lines that
+negotiationtest.py and the chat endpoints write into one session per
+conversation. Each seller turn is then replayed in-process through POST
+/chat (full history every turn) or the /sessions API. The model is one of:
+
+    recorded  the logged AI response, after its logged latency * --speed
+    stub      a fixed reply after --stub-latency seconds
+    live      the configured provider, through the real gateway
+
+Reports per-turn latency, prompt and completion tokens, JSON parse failures,
+is_ending_message outcomes and the share of turns taking the rule-based fast
+path:
+
+    python -m benchmarks.replay_negotiations --model recorded --speed 0
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+import contextlib
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep the app from appending the replay to the log being replayed
+logging.basicConfig(handlers=[logging.NullHandler()])
+
+import main  # noqa: E402
+
+LOG_LINE = re.compile(
+    r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - (\w+) - (.*)$")
+STUB_REPLY = json.dumps({
+    "role": "assistant",
+    "content": "Would you consider $90 if I pick it up today?",
+    "reasoning": "Stub reply for replay runs."
+})
+
+
+def count_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def read_entries(path: str) -> list:
+    # Reads both the JSON lines the app writes now and the older plain text
+    # lines, where multi-line messages (the pretty-printed AI responses)
+    # continue on lines without a timestamp
+    entries = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                    entries.append([
+                        datetime.datetime.fromisoformat(record["ts"]),
+                        record["level"], record["message"]
+                    ])
+                    continue
+                except (ValueError, KeyError):
+                    pass
+            match = LOG_LINE.match(line.rstrip("\n"))
+            if match:
+                stamp = datetime.datetime.strptime(match.group(1),
+                                                   "%Y-%m-%d %H:%M:%S,%f")
+                entries.append([stamp, match.group(2), match.group(3)])
+            elif entries:
+                entries[-1][2] += "\n" + line.rstrip("\n")
+    return entries
+
+
+def parse_sessions(path: str) -> list:
+    sessions, session, pending = [], None, None
+    for stamp, level, message in read_entries(path):
+        if message.startswith("Context: "):
+            session = {"context": message[len("Context: "):], "history": [],
+                       "turns": []}
+            sessions.append(session)
+            pending = None
+        elif session is None:
+            continue
+        elif message.startswith("Seller: "):
+            pending = {
+                "seller": message[len("Seller: "):],
+                "at": stamp,
+                "recorded": None,
+                "recorded_latency": None
+            }
+            session["turns"].append(pending)
+        elif message.startswith("Assistant: ") and pending is None:
+            # Opening messages seeded before the first logged seller turn
+            session["history"].append({
+                "role": "assistant",
+                "content": message[len("Assistant: "):]
+            })
+        elif message.startswith("AI Response: ") and pending is not None:
+            pending["recorded"] = message[len("AI Response: "):]
+            pending["recorded_latency"] = (stamp - pending["at"]).total_seconds()
+            pending = None
+    return [s for s in sessions if s["turns"]]
+
+
+class ReplayModel:
+    """Stands in for LLMGateway.complete and records what it was asked."""
+
+    def __init__(self, mode: str, speed: float, stub_latency: float):
+        self.mode = mode
+        self.speed = speed
+        self.stub_latency = stub_latency
+        self.live = main.gateway.complete
+        self.turn = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def complete(self, messages, **kwargs):
+        prompt = "\n".join(m["content"] for m in messages)
+        self.prompt_tokens = count_tokens(prompt)
+        if self.mode == "live":
+            reply = await self.live(messages, **kwargs)
+        elif self.mode == "recorded" and self.turn["recorded"] is not None:
+            await asyncio.sleep(self.turn["recorded_latency"] * self.speed)
+            reply = self.turn["recorded"]
+        else:
+            await asyncio.sleep(self.stub_latency)
+            reply = STUB_REPLY
+        self.completion_tokens = count_tokens(reply)
+        return reply
+
+
+async def replay_session(client, model, session, goal: str, path: str):
+    results = []
+    history = list(session["history"])
+    session_id = None
+    if path == "session":
+        response = await client.post("/sessions",
+                                     json={
+                                         "item_id": f"replay-{id(session)}",
+                                         "seller": "replay",
+                                         "context": session["context"],
+                                         "item_description": goal,
+                                         "chat_history": history
+                                     })
+        session_id = response.json()["session_id"]
+
+    for turn in session["turns"]:
+        model.turn = turn
+        # Stay zero for turns answered by the fast path
+        model.prompt_tokens = model.completion_tokens = 0
+        history.append({"role": "seller", "content": turn["seller"]})
+        start = time.perf_counter()
+        if path == "session":
+            response = await client.post(f"/sessions/{session_id}/chat",
+                                         json={"message": turn["seller"]})
+        else:
+            response = await client.post("/chat",
+                                         json={
+                                             "context": session["context"],
+                                             "item_description": goal,
+                                             "chat_history": history
+                                         })
+        latency = time.perf_counter() - start
+
+        body = response.json()
+        reply = body.get("response", body) if response.is_success else {}
+        content = reply.get("content", "")
+        parse_failure = (not response.is_success
+                         and "Invalid JSON" in str(body.get("detail")))
+        results.append({
+            "seller": turn["seller"],
+            "status": response.status_code,
+            "latency_ms": latency * 1000,
+            "prompt_tokens": model.prompt_tokens,
+            "completion_tokens": model.completion_tokens,
+            "parse_failure": parse_failure,
+            "ended": main.is_ending_message(content) if content else False,
+        })
+        if content:
+            history.append({"role": "assistant", "content": content})
+        if results[-1]["ended"]:
+            break
+    return results
+
+
+def summarize(turns: list) -> dict:
+    latencies = sorted(t["latency_ms"] for t in turns)
+    return {
+        "sessions": None,
+        "turns": len(turns),
+        "latency_p50_ms": statistics.median(latencies) if latencies else 0,
+        "latency_max_ms": latencies[-1] if latencies else 0,
+        "prompt_tokens_mean": statistics.mean(t["prompt_tokens"]
+                                              for t in turns) if turns else 0,
+        "prompt_tokens_max": max((t["prompt_tokens"] for t in turns),
+                                 default=0),
+        "completion_tokens_mean": statistics.mean(
+            t["completion_tokens"] for t in turns) if turns else 0,
+        "parse_failures": sum(t["parse_failure"] for t in turns),
+        "errors": sum(t["status"] >= 400 for t in turns),
+        "ended_sessions": None,
+    }
+
+
+async def run(args):
+    sessions = parse_sessions(args.log)
+    model = ReplayModel(args.model, args.speed, args.stub_latency)
+    main.gateway.complete = model.complete
+
+    lifespan = contextlib.nullcontext()
+    if args.path == "session":
+        # Sessions are stored in Postgres, so this path needs the app's pool
+        from benchmarks.load_test import prepare_database, start_database
+        main.DATABASE_URL = start_database(
+            tempfile.mkdtemp(prefix="bargain-replay-"))
+        await prepare_database(main.DATABASE_URL)
+        main.LLM_WARMUP = False
+        lifespan = main.lifespan(main.app)
+
+    transport = httpx.ASGITransport(app=main.app)
+    all_turns, ended = [], 0
+    async with lifespan, httpx.AsyncClient(transport=transport,
+                                           base_url="http://replay",
+                                           timeout=300) as client:
+        for i, session in enumerate(sessions):
+            turns = await replay_session(client, model, session, args.goal,
+                                         args.path)
+            ended += any(t["ended"] for t in turns)
+            all_turns.extend(turns)
+            if args.verbose:
+                for t in turns:
+                    print(f"[{i:02d}] {t['latency_ms']:8.1f} ms  "
+                          f"prompt {t['prompt_tokens']:5d}  "
+                          f"completion {t['completion_tokens']:4d}  "
+                          f"{'PARSE-FAIL ' if t['parse_failure'] else ''}"
+                          f"{'END ' if t['ended'] else ''}"
+                          f"seller: {t['seller'][:40]}")
+
+    summary = summarize(all_turns)
+    summary["sessions"] = len(sessions)
+    summary["ended_sessions"] = ended
+    summary["fast_path"] = main.fastpath.report()
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "turns": all_turns}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--log", default=os.path.join(ROOT, "negotiation.log"))
+    parser.add_argument("--model",
+                        choices=("recorded", "stub", "live"),
+                        default="recorded")
+    parser.add_argument("--path", choices=("chat", "session"), default="chat")
+    parser.add_argument("--goal", default="I want to buy a couch for $100")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="multiplier on recorded latencies (0 = instant)")
+    parser.add_argument("--stub-latency", type=float, default=0.0)
+    parser.add_argument("--output", help="write per-turn results as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    asyncio.run(run(parser.parse_args()))
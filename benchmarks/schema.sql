@@ -0,0 +1,24 @@
+-- Minimal item / item_search tables for the local benchmark database.
+-- The migrations in ../migrations are applied on top of this.
+CREATE TABLE IF NOT EXISTS item_search (
+    id serial PRIMARY KEY,
+    userid text,
+    searchitem text,
+    minprice double precision,
+    maxprice double precision
+);
+
+CREATE TABLE IF NOT EXISTS item (
+    id serial PRIMARY KEY,
+    description text,
+    searchid integer,
+    url text,
+    image text,
+    message text,
+    itemsearch text,
+    listedprice double precision,
+    estimateprice double precision,
+    minprice double precision,
+    maxprice double precision,
+    datepublished text
+);
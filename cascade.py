@@ -0,0 +1,143 @@
+import os
+import time
+
+import compact as compact_protocol
+import metrics
+from llm_gateway import gateway, DEFAULT_MODEL
+from sessions import extract_prices
+
+SMALL_MODEL = os.getenv("CASCADE_SMALL_MODEL",
+                        "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo")
+# Endpoints routed through the small model first, e.g. "validate,chat"
+# ("chat" covers /chat and sessions; /chat/stream stays on the large model).
+CASCADE_ENDPOINTS = {
+    endpoint.strip()
+    for endpoint in os.getenv("LLM_CASCADE", "").split(",")
+    if endpoint.strip()
+}
+# Small-model verdicts below this confidence go to the large model.
+MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.8"))
+
+cascade_decisions = metrics.register(
+    metrics.Counter(
+        "llm_cascade_decisions_total",
+        "Cascade outcomes: decided by the small tier, or escalated.",
+        ("endpoint", "tier", "outcome")))
+cascade_duration = metrics.register(
+    metrics.Histogram("llm_cascade_tier_duration_seconds",
+                      "Latency of each cascade tier.", ("endpoint", "tier")))
+
+stats = {}
+
+
+def enabled(endpoint: str) -> bool:
+    return endpoint in CASCADE_ENDPOINTS
+
+
+def record(endpoint: str, tier: str, seconds: float, decided: int,
+           escalated: int):
+    tier_stats = stats.setdefault(endpoint, {}).setdefault(
+        tier, {
+            "calls": 0,
+            "seconds": 0.0,
+            "decided": 0,
+            "escalated": 0
+        })
+    tier_stats["calls"] += 1
+    tier_stats["seconds"] += seconds
+    tier_stats["decided"] += decided
+    tier_stats["escalated"] += escalated
+    cascade_duration.observe(seconds, endpoint=endpoint, tier=tier)
+    if decided:
+        cascade_decisions.inc(decided,
+                              endpoint=endpoint,
+                              tier=tier,
+                              outcome="decided")
+    if escalated:
+        cascade_decisions.inc(escalated,
+                              endpoint=endpoint,
+                              tier=tier,
+                              outcome="escalated")
+
+
+async def triage_listings(request_text: str,
+                          items: list,
+                          escalate_relevant: bool = False) -> tuple:
+    """First validation pass on the small model.
+
+    Returns (verdicts, uncertain): ValidatedItem fields for the listings the
+    small model is confident about, and the listings left for the large
+    model. Any failure of the small tier escalates the whole batch. The
+    small tier only answers relevant/confidence, so with
+    `escalate_relevant` (callers wanting a written first message) a
+    relevant listing always goes on to the large model.
+    """
+    start = time.perf_counter()
+    messages = [{
+        "role": "user",
+        "content": compact_protocol.triage_prompt(request_text, items)
+    }]
+    try:
+        response = await gateway.complete(messages,
+                                          model=SMALL_MODEL,
+                                          max_tokens=16 * len(items) + 16,
+                                          temperature=0,
+                                          top_p=0.7)
+        triage = compact_protocol.parse_triage(response, items)
+    except Exception:
+        triage = {}
+
+    verdicts, uncertain = [], []
+    for index, item in enumerate(items):
+        relevant, confidence = triage.get(index, (0, 0.0))
+        if confidence < MIN_CONFIDENCE or (relevant and escalate_relevant):
+            uncertain.append(item)
+            continue
+        verdicts.append({
+            "item_id": item.url,
+            "reasoning": f"Small model triage (confidence {confidence:.2f})",
+            "relevant": relevant,
+            "first_message": (compact_protocol.DEFAULT_FIRST_MESSAGE
+                              if relevant else "Null"),
+        })
+    record("validate", "small", time.perf_counter() - start, len(verdicts),
+           len(uncertain))
+    return verdicts, uncertain
+
+
+async def negotiate(messages: list, parse, seller_message: str = "",
+                    **params) -> tuple:
+    """Negotiation turn through the cascade; returns (raw text, reply).
+
+    `parse` turns the raw completion into the reply dict and raises when it
+    can't. A seller message naming a price goes straight to the large model
+    (the reply will accept or counter it), as do small-model drafts that
+    fail to parse or make an offer themselves.
+
+    /chat/stream doesn't come through here: whether a draft escalates is
+    only known once it is complete, after its tokens would have been
+    streamed to the client, so streamed turns always use the large model.
+    """
+    if not enabled("chat"):
+        raw = await gateway.complete(messages, **params)
+        return raw, parse(raw)
+
+    escalate = bool(extract_prices(seller_message))
+    if not escalate:
+        start = time.perf_counter()
+        try:
+            raw = await gateway.complete(messages, model=SMALL_MODEL, **params)
+            reply = parse(raw)
+            escalate = bool(extract_prices(reply.get("content", "")))
+        except Exception:
+            escalate = True
+        record("chat", "small", time.perf_counter() - start,
+               int(not escalate), int(escalate))
+        if not escalate:
+            return raw, reply
+
+    start = time.perf_counter()
+    raw = await gateway.complete(messages, model=DEFAULT_MODEL, **params)
+    reply = parse(raw)
+    record("chat", "large", time.perf_counter() - start, 1, 0)
+    return raw, reply
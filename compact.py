@@ -0,0 +1,152 @@
+import os
+
+from structured_output import extract_json
+from Prompts.BrowsingAgent import RANK_COMPACT_PROMPT_TEMPLATE
+from Prompts.ValidateAgent import (VALIDATE_COMPACT_PROMPT_TEMPLATE,
+                                   VALIDATE_COMPACT_BATCH_PROMPT_TEMPLATE,
+                                   VALIDATE_TRIAGE_PROMPT_TEMPLATE,
+                                   VALIDATE_COMPACT_REASONING,
+                                   VALIDATE_COMPACT_EXAMPLE,
+                                   VALIDATE_COMPACT_REASONING_EXAMPLE)
+
+# Default for the ?compact= switch on /rank and /validate.
+COMPACT_DEFAULT = os.getenv("LLM_COMPACT_PROTOCOL", "false").lower() == "true"
+# Descriptions beyond this are cut; the tail rarely changes a verdict.
+DESCRIPTION_CHARS = int(os.getenv("COMPACT_DESCRIPTION_CHARS", "300"))
+DEFAULT_FIRST_MESSAGE = os.getenv("VALIDATE_FIRST_MESSAGE",
+                                  "Hi! Is this still available?")
+
+
+def _cell(value, limit: int = None) -> str:
+    text = " ".join(str(value if value is not None else "").split())
+    text = text.replace("|", "/")
+    if limit and len(text) > limit:
+        text = text[:limit - 3] + "..."
+    return text
+
+
+def encode_table(rows: list) -> str:
+    """One pipe-separated line per listing, numbered from 1."""
+    return "\n".join(
+        " | ".join([str(i)] + [_cell(*cell) for cell in row])
+        for i, row in enumerate(rows, 1))
+
+
+def _listing_id(value, count: int):
+    try:
+        listing_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return listing_id if 1 <= listing_id <= count else None
+
+
+def rank_prompt(request: str, items: list) -> str:
+    listings = encode_table([[(item.get("price"), ),
+                              (item.get("description"), DESCRIPTION_CHARS)]
+                             for item in items])
+    return RANK_COMPACT_PROMPT_TEMPLATE.format(request=request,
+                                               listings=listings)
+
+
+def parse_rank(text: str, items: list) -> list:
+    """Map the model's ordered id list back to listing urls."""
+    urls, seen = [], set()
+    for value in extract_json(text, expect=list):
+        listing_id = _listing_id(value, len(items))
+        if listing_id is not None and listing_id not in seen:
+            seen.add(listing_id)
+            urls.append(items[listing_id - 1].get("url"))
+    return urls
+
+
+def _validate_row(item) -> list:
+    return [(item.price, ), (item.listedprice, ), (item.datepublished, ),
+            (item.description, DESCRIPTION_CHARS),
+            (item.message, DESCRIPTION_CHARS)]
+
+
+def validate_prompt(request: str, items: list, reasoning: bool = False) -> str:
+    listings = encode_table([_validate_row(item) for item in items])
+    return VALIDATE_COMPACT_PROMPT_TEMPLATE.format(
+        request=request,
+        listings=listings,
+        reasoning=VALIDATE_COMPACT_REASONING if reasoning else "",
+        example=(VALIDATE_COMPACT_REASONING_EXAMPLE
+                 if reasoning else VALIDATE_COMPACT_EXAMPLE))
+
+
+def batch_validate_prompt(batch: list, reasoning: bool = False) -> str:
+    """One prompt for several (request, items) pairs; listings are numbered
+    across the whole batch and tagged with their request's number."""
+    requests = "\n".join(f"{i}: {_cell(request)}"
+                         for i, (request, _) in enumerate(batch, 1))
+    listings = encode_table([[(i, )] + _validate_row(item)
+                             for i, (_, items) in enumerate(batch, 1)
+                             for item in items])
+    return VALIDATE_COMPACT_BATCH_PROMPT_TEMPLATE.format(
+        requests=requests,
+        listings=listings,
+        reasoning=VALIDATE_COMPACT_REASONING if reasoning else "",
+        example=(VALIDATE_COMPACT_REASONING_EXAMPLE
+                 if reasoning else VALIDATE_COMPACT_EXAMPLE))
+
+
+def parse_batch_verdicts(text: str, batch: list) -> list:
+    """Split a batch answer back into one verdict list per request."""
+    flat = [item for _, items in batch for item in items]
+    owners = [i for i, (_, items) in enumerate(batch) for _ in items]
+    results = [[] for _ in batch]
+    for verdict in parse_verdicts(text, flat, with_ids=True):
+        listing_id = verdict.pop("listing_id")
+        results[owners[listing_id - 1]].append(verdict)
+    return results
+
+
+def parse_verdicts(text: str, items: list, with_ids: bool = False) -> list:
+    """Map [id, 0/1(, reason)] entries back to ValidatedItem fields."""
+    verdicts, seen = [], set()
+    for entry in extract_json(text, expect=list):
+        if not isinstance(entry, list) or len(entry) < 2:
+            continue
+        listing_id = _listing_id(entry[0], len(items))
+        if listing_id is None or listing_id in seen:
+            continue
+        seen.add(listing_id)
+        relevant = 1 if str(entry[1]).strip() in ("1", "True", "true") else 0
+        verdict = {
+            "item_id": items[listing_id - 1].url,
+            "reasoning": str(entry[2]) if len(entry) > 2 else "",
+            "relevant": relevant,
+            "first_message": DEFAULT_FIRST_MESSAGE if relevant else "Null",
+        }
+        if with_ids:
+            verdict["listing_id"] = listing_id
+        verdicts.append(verdict)
+    return verdicts
+
+
+def triage_prompt(request: str, items: list) -> str:
+    listings = encode_table([_validate_row(item) for item in items])
+    return VALIDATE_TRIAGE_PROMPT_TEMPLATE.format(request=request,
+                                                  listings=listings)
+
+
+def parse_triage(text: str, items: list) -> dict:
+    """Map [id, 0/1, confidence] entries to {index: (relevant, confidence)}."""
+    verdicts = {}
+    for entry in extract_json(text, expect=list):
+        if not isinstance(entry, list) or len(entry) < 3:
+            continue
+        listing_id = _listing_id(entry[0], len(items))
+        if listing_id is None or listing_id - 1 in verdicts:
+            continue
+        try:
+            confidence = float(entry[2])
+        except (TypeError, ValueError):
+            continue
+        # Some models answer in percent
+        if confidence > 1:
+            confidence /= 100
+        relevant = 1 if str(entry[1]).strip() in ("1", "True", "true") else 0
+        verdicts[listing_id - 1] = (relevant, confidence)
+    return verdicts
@@ -0,0 +1,184 @@
+import os
+import re
+
+import metrics
+from sessions import PRICE_PATTERN, extract_prices
+
+# Answer clear-cut seller messages from templates instead of the LLM.
+FAST_PATH_ENABLED = os.getenv("NEGOTIATION_FAST_PATH", "1") == "1"
+
+# Both closing lines match is_ending_message, so the turn ends the session.
+ACCEPT_MESSAGE = "Amazing, thank you!"
+DECLINE_MESSAGE = "Thank you, all the best!"
+CONDITION_QUESTION = "Great! What condition is it in?"
+
+_AGREE = (r"sure|yes|yeah|yep|yup|ok|okay|deal|fine|alright|done|"
+          r"sounds good|that works|works for me|that price works|"
+          r"it'?s a deal|you got it")
+AGREE_PATTERN = re.compile(rf"^(?:(?:{_AGREE})[\s,.!]*)+$")
+AVAILABLE_PATTERN = re.compile(
+    r"^(?:(?:yes|yeah|yep|yup|hi|hello|hey)[\s,.!]*)*"
+    r"(?:(?:it'?s|it is|this is|yes it'?s)\s+)?still available[\s.!]*$")
+REFUSAL_PATTERN = re.compile(
+    r"^(?:no|nope|nah|no thanks|not interested|sorry,? no)[\s.!]*$")
+FIRM_PATTERN = re.compile(
+    r"\b(?:not negotiable|non-?negotiable|not open to negotiation|"
+    r"(?:price|it) is firm|firm on|final (?:offer|price)|no lower|"
+    r"(?:won'?t|can'?t|not) go(?:ing)? (?:any )?lower|no lowballs?)\b")
+# A message that is nothing but one price on offer, once the price itself is
+# replaced by <price>: "$80", "$80 works", "I can do $80", "would you take $80?"
+OFFER_PATTERN = re.compile(
+    r"^(?:(?:hi|hey|hello|ok|okay|sure|yes|yeah|alright|fine)[\s,.!]*)*"
+    r"(?:(?:i can do|i could do|i'?ll do|i'?d do|i'?ll take|i'?d take|"
+    r"would you take|will you take|would you do|can you do|could you do|"
+    r"how about|let'?s do|let'?s say|make it)\s+)?"
+    r"<price>(?:\s+(?:works|would work|is fine|is ok|is okay|and it'?s yours"
+    r"|for you|then))?[\s,.!?]*$")
+LISTED_PATTERN = re.compile(r"\blisted (?:at|for) \$\s?\d[\d,]*(?:\.\d+)?",
+                            re.IGNORECASE)
+# Prices that are adjustments, costs on top or history, never a total offer.
+NOT_AN_OFFER_PATTERN = re.compile(
+    r"\b(?:discounts?|off|fees?|delivery|deliver|shipping|ship|extra|plus|"
+    r"sold|paid|each|per|deposit)\b")
+
+fast_path_turns = metrics.register(
+    metrics.Counter("negotiation_turns_total",
+                    "Negotiation turns by path (rule for fast-path turns).",
+                    ("path", "rule")))
+
+stats = {"turns": 0, "fast_path": 0, "rules": {}}
+
+
+def goal_price(users_goal: str):
+    """The buyer's target price, when the goal names exactly one."""
+    prices = extract_prices(users_goal)
+    return prices[0] if len(prices) == 1 else None
+
+
+def listed_price(context: str):
+    """The listing's price from the negotiation context, when it's clear.
+
+    "listed at $X" (as /negotiations writes it) wins, else the context has
+    to name exactly one price.
+    """
+    match = LISTED_PATTERN.search(context or "")
+    if match is not None:
+        return extract_prices(match.group(0))[0]
+    return goal_price(context)
+
+
+def _normalize(message: str) -> str:
+    return " ".join((message or "").lower().replace("’", "'").split())
+
+
+def _single_price(text: str):
+    prices = extract_prices(text)
+    return prices[0] if len(prices) == 1 else None
+
+
+def offered_price(seller_message: str):
+    """The price the seller offers, when the message is only that offer."""
+    text = _normalize(seller_message)
+    price = _single_price(text)
+    if price is None or NOT_AN_OFFER_PATTERN.search(text):
+        return None
+    if not OFFER_PATTERN.match(PRICE_PATTERN.sub("<price>", text)):
+        return None
+    return price
+
+
+def agreed_price(seller_message: str, last_offer: str, goal=None):
+    """The total the seller explicitly settled on within the goal, or None.
+
+    Either the seller's message offers exactly one price, or it is a plain
+    "yes" to our last offer and that offer named exactly one price.
+    """
+    price = offered_price(seller_message)
+    if price is None and AGREE_PATTERN.match(_normalize(seller_message)):
+        price = _single_price(last_offer or "")
+    if price is None or (goal is not None and price > goal):
+        return None
+    return price
+
+
+def _decide(seller_message: str, goal, last_offer: str, listed):
+    text = _normalize(seller_message)
+    if not text:
+        return None
+    prices = extract_prices(text)
+
+    if prices:
+        if NOT_AN_OFFER_PATTERN.search(text):
+            return None
+        price = offered_price(text)
+        if goal is not None and price is not None and price <= goal:
+            return "accept_below_goal", ACCEPT_MESSAGE, (
+                f"The seller offered ${price:g}, at or below the ${goal:g} "
+                f"goal.")
+        if (len(prices) == 1 and FIRM_PATTERN.search(text)
+                and goal is not None and prices[0] > goal):
+            return "firm_above_goal", DECLINE_MESSAGE, (
+                "The seller's firm price is above the goal.")
+        return None
+
+    if REFUSAL_PATTERN.match(text) or FIRM_PATTERN.search(text):
+        # Walking away only makes sense when the listing is over budget;
+        # within it (or unknown) the LLM gets to accept the asking price
+        if goal is not None and listed is not None and listed > goal:
+            return "hard_refusal", DECLINE_MESSAGE, (
+                f"The seller refused to negotiate on a ${listed:g} listing, "
+                f"above the ${goal:g} goal.")
+        return None
+    if AGREE_PATTERN.match(text):
+        price = agreed_price(text, last_offer, goal)
+        if goal is not None and price is not None:
+            return "accept_our_offer", ACCEPT_MESSAGE, (
+                f"The seller agreed to our ${price:g} offer.")
+        return None
+    if AVAILABLE_PATTERN.match(text) and "condition" not in last_offer.lower():
+        return "still_available", CONDITION_QUESTION, (
+            "The item is available; asking about its condition first.")
+    return None
+
+
+def reply(seller_message: str,
+          users_goal: str,
+          last_offer: str = "",
+          context: str = ""):
+    """Deterministic reply to a trivial seller message, or None.
+
+    `last_offer` is our previous message, so a bare "sure" can be matched to
+    the price it agrees to, and `context` the listing, whose price decides
+    whether a refusal ends the chat. Only cases the negotiation prompt itself
+    settles are answered here (a bare offer of one price at or below the
+    goal, agreement to our offer, a hard refusal on a listing above the
+    goal, a plain "still available");
+    anything else, including every counter-offer above the goal and any
+    message that also talks about discounts, fees or past sales, returns
+    None and goes to the LLM.
+    """
+    stats["turns"] += 1
+    decision = (_decide(seller_message, goal_price(users_goal), last_offer
+                        or "", listed_price(context))
+                if FAST_PATH_ENABLED else None)
+    if decision is None:
+        fast_path_turns.inc(path="llm", rule="")
+        return None
+    rule, content, reasoning = decision
+    stats["fast_path"] += 1
+    stats["rules"][rule] = stats["rules"].get(rule, 0) + 1
+    fast_path_turns.inc(path="fast", rule=rule)
+    return {
+        "role": "assistant",
+        "content": content,
+        "reasoning": f"Fast path ({rule}): {reasoning}"
+    }
+
+
+def report() -> dict:
+    return {
+        "enabled": FAST_PATH_ENABLED,
+        **stats,
+        "fraction": (stats["fast_path"] / stats["turns"]
+                     if stats["turns"] else 0.0),
+    }
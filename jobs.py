@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import logging
+import os
+import random
+import time
+import uuid
+
+import metrics
+from response_cache import TTLCache
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "1000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# First retry waits about this long, doubling with each further attempt.
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "2"))
+# Finished jobs stay fetchable this long.
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, kind: str, factory, priority: int):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.factory = factory
+        self.priority = priority
+        self.status = "queued"
+        self.attempts = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.retry_at = None
+        self.task = None
+        self.finished = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "attempts": self.attempts,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "retry_at": self.retry_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """In-process priority queue drained by a fixed pool of workers.
+
+    `factory` is called once per attempt and must return a fresh awaitable.
+    Failed attempts are retried with jittered exponential backoff (the job
+    waits outside the queue, so it holds no worker meanwhile) until
+    max_attempts; finished jobs are kept for result_ttl seconds.
+    Higher priorities run first, equal ones in submission order.
+    """
+
+    def __init__(self,
+                 workers: int = JOB_WORKERS,
+                 max_pending: int = JOB_MAX_PENDING,
+                 max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retry_backoff: float = JOB_RETRY_BACKOFF,
+                 result_ttl: float = JOB_RESULT_TTL):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.jobs = TTLCache(max_entries=max_pending * 10, ttl=result_ttl)
+        self._queue = None
+        self._workers = []
+        self._sequence = itertools.count()
+        self._pending = 0
+        self._closing = False
+
+    async def start(self):
+        self._closing = False
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        while len(self._workers) < self.workers:
+            self._workers.append(asyncio.create_task(self._work()))
+
+    async def close(self):
+        self._closing = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def submit(self, kind: str, factory, priority: int = 0) -> Job:
+        if self._pending >= self.max_pending:
+            raise QueueFullError(
+                f"{self._pending} jobs pending, try again later")
+        job = Job(kind, factory, priority)
+        self.jobs.set(job.job_id, job)
+        self._pending += 1
+        self._enqueue(job)
+        return job
+
+    def _enqueue(self, job: Job):
+        if job.status == "cancelled":
+            return
+        job.status = "queued"
+        job.retry_at = None
+        self._queue.put_nowait((-job.priority, next(self._sequence), job))
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float):
+        """Long-poll: return the job once finished or after `timeout`."""
+        job = self.jobs.get(job_id)
+        if job is not None and job.status not in FINISHED and timeout > 0:
+            try:
+                await asyncio.wait_for(job.finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def cancel(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        self._finish(job, "cancelled")
+        return job
+
+    def _finish(self, job: Job, status: str, result=None, error=None):
+        if job.status in FINISHED:
+            return
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.factory = None
+        job.task = None
+        self._pending -= 1
+        # Re-set so the result TTL runs from completion
+        self.jobs.set(job.job_id, job)
+        job.finished.set()
+
+    async def _work(self):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.status == "cancelled":
+                continue
+            job.status = "running"
+            job.attempts += 1
+            job.started_at = job.started_at or time.time()
+            job.task = asyncio.ensure_future(job.factory())
+            try:
+                result = await job.task
+            except asyncio.CancelledError:
+                if job.status == "cancelled" and not self._closing:
+                    continue
+                # The worker itself is shutting down
+                if job.task is not None:
+                    job.task.cancel()
+                raise
+            except Exception as e:
+                job.task = None
+                self._retry_or_fail(job, e)
+            else:
+                self._finish(job, "succeeded", result=result)
+
+    def _retry_or_fail(self, job: Job, error: Exception):
+        if job.attempts >= self.max_attempts:
+            logger.warning("Job %s failed after %d attempts: %s", job.job_id,
+                           job.attempts, error)
+            self._finish(job, "failed", error=str(error))
+            return
+        delay = self.retry_backoff * 2**(job.attempts - 1)
+        delay *= random.uniform(0.5, 1.5)
+        job.status = "retrying"
+        job.error = str(error)
+        job.retry_at = time.time() + delay
+        logger.info("Job %s attempt %d failed, retrying in %.1fs: %s",
+                    job.job_id, job.attempts, delay, error)
+        asyncio.get_running_loop().call_later(delay, self._enqueue, job)
+
+    def counts(self) -> dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[(job.kind, job.status)] = counts.get(
+                (job.kind, job.status), 0) + 1
+        return counts
+
+
+validation_jobs = JobQueue()
+metrics.register(
+    metrics.Gauge("jobs", "Background jobs by kind and status.",
+                  ("kind", "status"), validation_jobs.counts))
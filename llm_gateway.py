@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import httpx
+
+import metrics
+from singleflight import SingleFlight
+
+DEFAULT_MODEL = "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo"
+DEFAULT_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+
+class LLMTimeoutError(Exception):
+    pass
+
+
+class LLMGateway:
+    """Async, pooled access to the chat completion providers.
+
+    One shared httpx connection pool is kept per gateway, each provider gets
+    its own concurrency cap (LLM_MAX_CONCURRENCY_<PROVIDER>, falling back to
+    LLM_MAX_CONCURRENCY) and every call is bounded by a timeout so a stuck
+    completion can never hold the event loop or a semaphore slot forever.
+    """
+
+    def __init__(self, provider: str = DEFAULT_PROVIDER,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.provider = provider
+        self.timeout = timeout
+        self._http_client = None
+        self._clients = {}
+        self._semaphores = {}
+        self.inflight = SingleFlight()
+
+    async def start(self):
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100,
+                                    max_keepalive_connections=20),
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+            )
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def warm_up(self, provider: str = None):
+        """Create the provider client and open a connection to its API, so
+        the first completion doesn't pay for the SDK import and handshake."""
+        client = await self._client(provider or self.provider)
+        # Any status will do; the point is the TLS connection left in the pool
+        await self._http_client.head(str(client.base_url))
+
+    def _semaphore(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self._semaphores:
+            limit = int(
+                os.getenv(f"LLM_MAX_CONCURRENCY_{provider.upper()}",
+                          DEFAULT_MAX_CONCURRENCY))
+            self._semaphores[provider] = asyncio.Semaphore(limit)
+        return self._semaphores[provider]
+
+    async def _client(self, provider: str):
+        if provider not in self._clients:
+            await self.start()
+            # SDKs are imported on first use: together alone takes a third of
+            # the app's import time, and only one provider is normally used
+            if provider == "groq":
+                from groq import AsyncGroq
+                self._clients[provider] = AsyncGroq(
+                    api_key=os.getenv("GROQ_API_KEY"),
+                    http_client=self._http_client,
+                    max_retries=0)
+            elif provider == "together":
+                from together import AsyncTogether
+                self._clients[provider] = AsyncTogether(
+                    api_key=os.getenv("TOGETHER_API_KEY"),
+                    http_client=self._http_client,
+                    max_retries=0)
+            else:
+                raise ValueError(f"Unknown LLM provider: {provider}")
+        return self._clients[provider]
+
+    def _params(self, provider: str, top_k, repetition_penalty) -> dict:
+        # Groq's OpenAI-compatible API has no top_k / repetition_penalty.
+        if provider == "together":
+            return {"top_k": top_k, "repetition_penalty": repetition_penalty}
+        return {}
+
+    async def complete(self,
+                       messages: list,
+                       *,
+                       model: str = DEFAULT_MODEL,
+                       provider: str = None,
+                       max_tokens: int = 1024,
+                       temperature: float = 0,
+                       top_p: float = 0.7,
+                       top_k: int = 50,
+                       repetition_penalty: float = 1,
+                       timeout: float = None) -> str:
+        provider = provider or self.provider
+        params = dict(model=model,
+                      max_tokens=max_tokens,
+                      temperature=temperature,
+                      top_p=top_p,
+                      top_k=top_k,
+                      repetition_penalty=repetition_penalty,
+                      timeout=timeout)
+        if temperature != 0:
+            return await self._complete(messages, provider, **params)
+        # Deterministic calls with an identical prompt and parameters share
+        # one in-flight completion
+        key = hashlib.sha256(
+            json.dumps([provider, messages, params],
+                       sort_keys=True).encode()).hexdigest()
+        return await self.inflight.do(
+            key, lambda: self._complete(messages, provider, **params))
+
+    async def _complete(self, messages: list, provider: str, *, model,
+                        max_tokens, temperature, top_p, top_k,
+                        repetition_penalty, timeout) -> str:
+        client = await self._client(provider)
+        async with self._semaphore(provider):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                completion = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        **self._params(provider, top_k, repetition_penalty),
+                    ),
+                    timeout=timeout or self.timeout,
+                )
+                outcome = "ok"
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise LLMTimeoutError(
+                    f"{provider} completion timed out after "
+                    f"{timeout or self.timeout}s")
+            finally:
+                metrics.llm_request_duration.observe(
+                    time.perf_counter() - start,
+                    route=metrics.current_route.get(),
+                    model=model,
+                    provider=provider,
+                    mode="complete",
+                    outcome=outcome)
+        content = completion.choices[0].message.content
+        metrics.record_usage(model, messages, content,
+                             getattr(completion, "usage", None))
+        return content
+
+    async def stream(self,
+                     messages: list,
+                     *,
+                     model: str = DEFAULT_MODEL,
+                     provider: str = None,
+                     max_tokens: int = 1024,
+                     temperature: float = 0,
+                     top_p: float = 0.7,
+                     top_k: int = 50,
+                     repetition_penalty: float = 1,
+                     timeout: float = None):
+        """Yield the completion text in deltas as the provider produces it.
+
+        The timeout bounds the whole completion, not each chunk. Closing the
+        generator early closes the upstream response as well.
+        """
+        provider = provider or self.provider
+        timeout = timeout or self.timeout
+        client = await self._client(provider)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        route = metrics.current_route.get()
+        text = []
+        async with self._semaphore(provider):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        stream=True,
+                        **self._params(provider, top_k, repetition_penalty),
+                    ),
+                    timeout=timeout,
+                )
+                chunks = response.__aiter__()
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                chunks.__anext__(),
+                                timeout=max(deadline - loop.time(), 0))
+                        except StopAsyncIteration:
+                            break
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if not text:
+                                metrics.llm_time_to_first_token.observe(
+                                    time.perf_counter() - start,
+                                    route=route,
+                                    model=model,
+                                    provider=provider)
+                            text.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                    outcome = "ok"
+                finally:
+                    await response.close()
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise LLMTimeoutError(
+                    f"{provider} completion timed out after {timeout}s")
+            except GeneratorExit:
+                # Closed early by the consumer, e.g. once the reply is complete
+                outcome = "closed"
+                raise
+            finally:
+                metrics.llm_request_duration.observe(
+                    time.perf_counter() - start,
+                    route=route,
+                    model=model,
+                    provider=provider,
+                    mode="stream",
+                    outcome=outcome)
+                metrics.record_usage(model, messages, "".join(text))
+
+
+gateway = LLMGateway()
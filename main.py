@@ -1,32 +1,78 @@
+# First, so the startup timing report covers every import below
+import startup
 import os
-from fastapi import FastAPI, HTTPException, Query, Request
-from pydantic import BaseModel, ValidationError
-import asyncpg
-from contextlib import asynccontextmanager
+import asyncio
+import base64
+import time
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import AliasChoices, BaseModel, Field, ValidationError
+from contextlib import aclosing, asynccontextmanager
 from dotenv import load_dotenv
-from together import Together
-from typing import List
-from Prompts.BrowsingAgent import RANK_PROMPT_TEMPLATE
+from typing import List, Optional
+from Prompts.BrowsingAgent import RANK_PROMPT_TEMPLATE, RANK_COMPACT_PROMPT_TEMPLATE
 from Prompts.NegotiationAgent import NEGOTIATION_PROMPT_TEMPLATE
-from Prompts.ValidateAgent import VALIDATE_PROMPT_TEMPLATE
+from Prompts.ValidateAgent import (VALIDATE_PROMPT_TEMPLATE,
+                                   VALIDATE_BATCH_PROMPT_TEMPLATE,
+                                   VALIDATE_COMPACT_PROMPT_TEMPLATE,
+                                   VALIDATE_COMPACT_REASONING)
 import json
 import json
 import re
 import logging
-from groq import Groq
-
-
-logging.basicConfig(filename='negotiation.log',
-                    level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+from app_logging import RequestIdMiddleware, setup_logging
+from startup import FirstRequestMiddleware
+from jobs import validation_jobs, QueueFullError
+from llm_gateway import gateway, LLMTimeoutError, DEFAULT_MODEL
+import metrics
+import compact as compact_protocol
+from prefilter import prefilter
+from percolator import search_index
+from batcher import MicroBatcher
+import cascade
+import fastpath
+import orchestrator
+from ranking import (rank_listings, rank_sharded_stream, rank_shard,
+                     shard_listings, estimate_tokens, SHARD_TOKEN_BUDGET,
+                     COMPACT_SHARD_TOKEN_BUDGET)
+from pipeline import Pipeline
+import repository
+from repository import (upsert_items, item_projection, has_items,
+                        fetch_items_page, iter_items)
+from sessions import (NegotiationSession, session_id_for, session_store,
+                      SESSION_TTL)
+import structured_output
+from structured_output import (parse_list, parse_object, extract_json,
+                               StructuredOutputError)
+from streaming import ContentFieldParser, sse_event
+from response_cache import response_cache, verdict_cache, make_key, verdict_key
+
+
+# JSON lines to a rotating negotiation.log, written off the event loop
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL")
+# A pool that fails to open is retried after this delay, doubling up to the
+# cap, until it opens or the app shuts down.
+DB_OPEN_RETRY_DELAY = float(os.getenv("DB_OPEN_RETRY_DELAY", "0.5"))
+DB_OPEN_RETRY_MAX_DELAY = float(os.getenv("DB_OPEN_RETRY_MAX_DELAY", "30"))
+# Validation calls arriving within this window are merged into one prompt,
+# up to the token budget of listing text (0 disables batching).
+VALIDATE_BATCH_WINDOW_MS = float(os.getenv("VALIDATE_BATCH_WINDOW_MS", "20"))
+VALIDATE_BATCH_TOKEN_BUDGET = int(
+    os.getenv("VALIDATE_BATCH_TOKEN_BUDGET", "3000"))
+# Connect to the LLM provider at startup instead of on the first request.
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"
+
+metrics.register(
+    metrics.Gauge("startup_phase_seconds",
+                  "Startup timing: imports, pool open, LLM handshake, ready "
+                  "and first request.", ("phase", ), startup.phase_seconds))
 # FastAPI app initialization
 # app = FastAPI()
 
@@ -91,6 +137,9 @@ class ValidateItem(BaseModel):
 class ValidateRequest(BaseModel):
     request: str
     items: List[ValidateItem]
+    searchid: Optional[int] = None
+    minprice: Optional[float] = None
+    maxprice: Optional[float] = None
 
 
 class ValidatedItem(BaseModel):
@@ -100,6 +149,27 @@ class ValidatedItem(BaseModel):
     first_message: str
 
 
+class PercolateRequest(BaseModel):
+    items: List[ValidateItem]
+
+
+class PipelineItem(ValidateItem):
+    # Scraped listings (see shortItem) call it imageUrl
+    image: str = Field("", validation_alias=AliasChoices("image", "imageUrl"))
+
+
+class PipelineRequest(BaseModel):
+    request: str
+    searchid: int
+    items: List[PipelineItem]
+    minprice: Optional[float] = None
+    maxprice: Optional[float] = None
+
+
+class BatchValidatedItem(ValidatedItem):
+    request: int
+
+
 class ValidateResponse(BaseModel):
     validated_items: List[ValidatedItem]
 
@@ -121,7 +191,7 @@ class ChatRequest(BaseModel):
 
 
 class NegotiationResponse(BaseModel):
-    reasoning: str
+    reasoning: str = ""
     content: str
 
 
@@ -130,79 +200,194 @@ class ChatResponse(BaseModel):
     conversation_ended: bool
 
 
+class SessionCreate(BaseModel):
+    item_id: str
+    seller: str
+    context: str
+    item_description: str
+    chat_history: List[Message] = []
+
+
+class SessionMessage(BaseModel):
+    message: str
+
+
 # Lifespan context manager for resource management
+async def _open_database(database: repository.DeferredPool):
+    start = time.perf_counter()
+    delay = DB_OPEN_RETRY_DELAY
+    while True:
+        try:
+            await database.open(DATABASE_URL)
+            break
+        except Exception as e:
+            logger.error("Database pool failed to open, retrying in %gs: %s",
+                         delay, e)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, DB_OPEN_RETRY_MAX_DELAY)
+    startup.mark("pool_open", start)
+    try:
+        async with app.state.db_pool.acquire() as conn:
+            search_index.load(await repository.fetch_searches(conn))
+    except Exception as e:
+        logger.warning("Saved search index not loaded: %s", e)
+    app.state.ready = True
+    startup.mark("ready")
+    logger.info("Startup timing", extra={"payload": startup.report()})
+
+
+async def _warm_up_llm():
+    start = time.perf_counter()
+    try:
+        await gateway.warm_up()
+    except Exception as e:
+        logger.warning("LLM warm-up failed: %s", e)
+        return
+    startup.mark("llm_handshake", start)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize asyncpg connection pool
-    app.state.db_pool = await asyncpg.create_pool(DATABASE_URL)
+    # The pool (acquire waits are timed for /metrics) opens in the
+    # background so requests are accepted at once; those needing the
+    # database wait for it, and /ready turns 200 when it is warm
+    app.state.database = repository.DeferredPool()
+    app.state.db_pool = metrics.InstrumentedPool(app.state.database)
+    app.state.ready = False
+    await gateway.start()
+    await validation_jobs.start()
+    background = [asyncio.create_task(_open_database(app.state.database))]
+    if LLM_WARMUP:
+        background.append(asyncio.create_task(_warm_up_llm()))
     yield
     # Clean up (close connection pool) when app shuts down
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await negotiations.close()
+    await validation_jobs.close()
+    await gateway.close()
     await app.state.db_pool.close()
 
 
 # FastAPI app initialization with lifespan
 app = FastAPI(lifespan=lifespan)
+# Every route below is timed under its path template
+app.router.route_class = metrics.MetricsRoute
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(FirstRequestMiddleware)
+
+
+# Readiness probe: 503 until the pool is open and warm. Unlike /test_db it
+# never waits on the database.
+@app.get("/ready")
+async def ready(response: Response):
+    body = {"ready": app.state.ready, "startup": startup.report()}
+    if app.state.database.error is not None:
+        body["error"] = str(app.state.database.error)
+    if not app.state.ready:
+        response.status_code = 503
+    return body
 
 
 # Test connection endpoint
 @app.get("/test_db")
 async def test_db():
     try:
-        conn = await app.state.db_pool.acquire()
-        version = await conn.fetchval("SELECT version();")
-        await app.state.db_pool.release(conn)
+        async with app.state.db_pool.acquire() as conn:
+            version = await repository.server_version(conn)
         return {"PostgreSQL Version": version}
     except Exception as e:
         raise HTTPException(status_code=500,
                             detail=f"Database connection failed: {e}")
 
 
+async def _price_window(searchid, minprice=None, maxprice=None):
+    # Explicit bounds win; otherwise use the ones saved by /searchItems
+    if minprice is not None or maxprice is not None or searchid is None:
+        return minprice, maxprice
+    try:
+        async with app.state.db_pool.acquire() as conn:
+            row = await repository.search_price_window(conn, searchid)
+    except Exception as e:
+        logger.warning("Price window lookup failed: %s", e)
+        return None, None
+    if row is None:
+        return None, None
+    return row["minprice"], row["maxprice"]
+
+
+async def _rank_event_stream(request_text: str, items: list, cache_key: str,
+                             prefilter_report: dict, compact: bool):
+    yield json.dumps({"type": "prefilter", "report": prefilter_report}) + "\n"
+    try:
+        async for event in rank_sharded_stream(request_text,
+                                               items,
+                                               compact=compact):
+            if event["type"] == "final":
+                response_cache.set(cache_key, event["urls"])
+            yield json.dumps(event) + "\n"
+    except Exception as e:
+        yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+
 @app.post("/rank")
-async def rank_endpoint(request: Request):
+async def rank_endpoint(request: Request,
+                        response: Response,
+                        stream: bool = False,
+                        compact: bool = compact_protocol.COMPACT_DEFAULT):
     try:
         # Parse request JSON
         request_json = await request.json()
-        print("Parsed request:", request_json)
-
-        # Create listings text
-        listings_text = "\n\n".join([
-            f"Item description: {item.get('description', 'N/A')}\n"
-            f"Price: {item.get('price', 'N/A')}\n"
-            f"url: {item.get('url', 'N/A')}"
-            for item in request_json.get("items", [])
-        ])
-        print("Listings text:", listings_text)
-
-        rank_prompt = RANK_PROMPT_TEMPLATE.format(request=request_json.get(
-            "request", ""),
-                                                  listings=listings_text)
-        messages = [{"role": "user", "content": rank_prompt}]
-        completion = client.chat.completions.create(
-            model="meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo",
-            messages=messages,
-            max_tokens=1024,
-            temperature=0,
-            top_p=0.7,
-            top_k=50,
-            repetition_penalty=1,
-        )
-        rank_response = completion.choices[0].message.content
-        print("Raw AI response:", rank_response)
-
-        # Attempt to clean the response if it's not a valid JSON
-        cleaned_response = rank_response.strip()
-        if not (cleaned_response.startswith('[')
-                and cleaned_response.endswith(']')):
-            cleaned_response = cleaned_response.split('[',
-                                                      1)[-1].rsplit(']', 1)[0]
-            cleaned_response = f"[{cleaned_response}]"
-        print("Cleaned response:", cleaned_response)
-
-        parsed_response = json.loads(cleaned_response)
-        print("Parsed response:", parsed_response)
-
-        # Extract the URLs
-        url_list = [item['url'] for item in parsed_response]
+        logger.debug("Parsed request", extra={"payload": request_json})
+
+        items = request_json.get("items", [])
+        request_text = request_json.get("request", "")
+        # Resolved up front: the prefilter's price window changes the result,
+        # so it is part of the cache key
+        minprice, maxprice = await _price_window(
+            request_json.get("searchid"), request_json.get("minprice"),
+            request_json.get("maxprice"))
+
+        cache_key = make_key(
+            DEFAULT_MODEL,
+            RANK_COMPACT_PROMPT_TEMPLATE if compact else RANK_PROMPT_TEMPLATE,
+            {
+                "request": request_text,
+                "items": [[
+                    item.get('description'),
+                    item.get('price'),
+                    item.get('url')
+                ] for item in items],
+                "minprice": minprice,
+                "maxprice": maxprice,
+            })
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            if stream:
+                return StreamingResponse(iter([
+                    json.dumps({"type": "final", "urls": cached}) + "\n"
+                ]),
+                                         media_type="application/x-ndjson")
+            return cached
+
+        # Drop out-of-range and duplicate listings and keep the best lexical
+        # matches before they reach the model
+        items, prefilter_report = prefilter(request_text, items, minprice,
+                                            maxprice)
+        logger.info("Prefilter report", extra={"payload": prefilter_report})
+
+        # Large listing sets are split into token-budgeted shards that are
+        # ranked concurrently and merged
+        if stream:
+            return StreamingResponse(_rank_event_stream(
+                request_text, items, cache_key, prefilter_report, compact),
+                                     media_type="application/x-ndjson")
+
+        response.headers["X-Prefilter-Report"] = json.dumps(prefilter_report)
+
+        url_list = await rank_listings(request_text, items, compact)
+        response_cache.set(cache_key, url_list)
         # Ensure the response is in the correct format
         return url_list
         # top_listings = [Listing(**url) for url in parsed_response]
@@ -211,13 +396,15 @@ async def rank_endpoint(request: Request):
         #     return BrowsingResponse(top_listings=None)
         # return BrowsingResponse(top_listings=top_listings)
     
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except json.JSONDecodeError as json_error:
-        print(f"JSON Decode Error: {str(json_error)}")
+        logger.error("JSON Decode Error: %s", json_error)
         raise HTTPException(
             status_code=500,
             detail=f"Invalid JSON response from AI: {str(json_error)}")
     except Exception as e:
-        print(f"Unexpected Error: {str(e)}")
+        logger.exception("Unexpected Error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -227,17 +414,14 @@ async def search_item(request: Request):
     try:
         # print(item)
         item = await request.json()
-        print("Parsed request:", item)
-
-        conn = await app.state.db_pool.acquire()
-        query = """
-            INSERT INTO item_search (userid, searchitem, minprice, maxprice)
-            VALUES ($1, $2, $3, $4)
-            RETURNING id, userid, searchitem, minprice, maxprice
-        """
-        result = await conn.fetchrow(query, item['userid'], item['searchitem'],
-                                     item['minprice'], item['maxprice'])
-        await app.state.db_pool.release(conn)
+        logger.debug("Parsed request", extra={"payload": item})
+
+        async with app.state.db_pool.acquire() as conn:
+            result = await repository.insert_search(conn, item['userid'],
+                                                    item['searchitem'],
+                                                    item['minprice'],
+                                                    item['maxprice'])
+        search_index.add(result)
         return {
             "id": result["id"],
             "userid": result["userid"],
@@ -254,20 +438,10 @@ async def search_item(request: Request):
 async def create_item(request: Request):
     try:
         item = await request.json()
-        print("Parsed request:", item)
-        
-        conn = await app.state.db_pool.acquire()
-        query = """
-            INSERT INTO item (description, searchid, url, image, message, itemsearch, listedprice, estimateprice, minprice, maxprice, datepublished))
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-            RETURNING id, description, searchid, url, image, message, itemsearch, listedprice, estimateprice, minprice, maxprice, datepublished
-        """
-        result = await conn.fetchrow(query, item['description'], item['searchid'],
-                                     item['url'], item['image'], item['message'],
-                                     item['itemsearch'], item['listedprice'],
-                                     item['estimateprice'], item['minprice'],
-                                     item['maxprice'], item['datepublished'])
-        await app.state.db_pool.release(conn)
+        logger.debug("Parsed request", extra={"payload": item})
+
+        async with app.state.db_pool.acquire() as conn:
+            result = await repository.insert_item(conn, item)
         return {
             "id": result["id"],
             "description": result["description"],
@@ -294,18 +468,8 @@ class ItemList(BaseModel):
 @app.post("/viable")
 async def viable(item: Item):
     try:
-        conn = await app.state.db_pool.acquire()
-        query = """
-            INSERT INTO item (description, searchid, url, image, message, itemsearch, listedprice, estimateprice, minprice, maxprice, datepublished)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-            RETURNING id, description, searchid, url, image, message, itemsearch, listedprice, estimateprice, minprice, maxprice, datepublished
-        """
-        result = await conn.fetchrow(query, item['description'], item['searchid'],
-             item['url'], item['image'], item['message'],
-             item['itemsearch'], item['listedprice'],
-             item['estimateprice'], item['minprice'],
-             item['maxprice'], item['datepublished'])
-        await app.state.db_pool.release(conn)
+        async with app.state.db_pool.acquire() as conn:
+            result = await repository.insert_item(conn, item.model_dump())
         return {
             "id": result["id"],
             "description": result["description"],
@@ -330,84 +494,390 @@ async def viables(request: Request):
     try:
         request_json = await request.json()
         # print("Parsed request:", request_json)
-        conn = await app.state.db_pool.acquire()
-        query = """
-            INSERT INTO item (description, searchid, url, image, message, itemsearch, listedprice, estimateprice, minprice, maxprice, datepublished)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-            RETURNING id, description, searchid, url, image, message, itemsearch, listedprice, estimateprice, minprice, maxprice, datepublished
-        """
-        for item in request_json.get("items", []):
-
-            result = await conn.fetchrow(query, item.get('description', 'N/A'), item.get('searchid', 'N/A'),
-                 item.get('url', 'N/A'), item.get('image', 'N/A'), item.get('message', 'N/A'),
-                 item.get('itemsearch', 'N/A'), item.get('listedprice', 'N/A'),
-                 item.get('estimateprice', 'N/A'), item.get('minprice', 'N/A'),
-                 item.get('maxprice', 'N/A'), item.get('datepublished', 'N/A'))
-        await app.state.db_pool.release(conn)
-        return "Added viable options"
+        async with app.state.db_pool.acquire() as conn:
+            counts = await upsert_items(conn, request_json.get("items", []))
+        return {"message": "Added viable options", **counts}
     except Exception as e:
         raise HTTPException(status_code=500,
                             detail=f"Failed to create item: {e}")
 
 
-@app.get("/viables")
-async def getViables(id: int = Query(...)):
-    try:
-        conn = await app.state.db_pool.acquire()
-        query = "SELECT * FROM item WHERE searchid = $1"
-        params = id
-        items = await conn.fetch(query, params)
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
 
-        if not items:
-            raise HTTPException(status_code=404, detail="Item not found")
 
-        return items
+def _decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _stream_viables(searchid: int, after_id: Optional[int], fields,
+                          as_array: bool):
+    # Rows are read through a server-side cursor and written out one by one,
+    # so memory stays flat however many items the search has
+    async with app.state.db_pool.acquire() as conn:
+        if as_array:
+            yield "["
+        first = True
+        async for row in iter_items(conn, searchid, after_id, fields):
+            line = json.dumps(dict(row), default=str)
+            if as_array:
+                yield line if first else "," + line
+            else:
+                yield line + "\n"
+            first = False
+        if as_array:
+            yield "]"
+
 
+@app.get("/viables")
+async def getViables(id: int = Query(...),
+                     limit: Optional[int] = Query(None, ge=1, le=1000),
+                     cursor: Optional[str] = None,
+                     fields: Optional[str] = None,
+                     format: str = Query("json", pattern="^(json|ndjson)$")):
+    try:
+        after_id = _decode_cursor(cursor)
+        field_list = fields.split(",") if fields else None
+        item_projection(field_list)
+
+        if limit is not None:
+            async with app.state.db_pool.acquire() as conn:
+                items = await fetch_items_page(conn, id, limit + 1, after_id,
+                                               field_list)
+            if not items and after_id is None:
+                raise HTTPException(status_code=404, detail="Item not found")
+            next_cursor = (_encode_cursor(items[limit - 1]["id"])
+                           if len(items) > limit else None)
+            return {
+                "items": [dict(item) for item in items[:limit]],
+                "next_cursor": next_cursor
+            }
+
+        async with app.state.db_pool.acquire() as conn:
+            if not await has_items(conn, id):
+                raise HTTPException(status_code=404, detail="Item not found")
+
+        if format == "ndjson":
+            return StreamingResponse(_stream_viables(id, after_id, field_list,
+                                                     False),
+                                     media_type="application/x-ndjson")
+        return StreamingResponse(_stream_viables(id, after_id, field_list,
+                                                 True),
+                                 media_type="application/json")
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # Ensure the connection is released back to the pool
-        if conn:
-            await app.state.db_pool.release(conn)
 
 
-@app.post("/validate", response_model=ValidateResponse)
-async def validate_endpoint(request: ValidateRequest):
-    try:
-        listings_text = "\n\n".join([
-            f"Item description: {item.description}\n"
-            f"Price: {item.price}\n"
-            f"Listed price: {item.listedprice}\n"
-            f"Message: {item.message}\n"
-            f"Date published: {item.datepublished}\n"
-            f"URL: {item.url}" for item in request.items
-        ])
-
-        validate_prompt = VALIDATE_PROMPT_TEMPLATE.format(
-            request=request.request, listings=listings_text)
-
-        messages = [{"role": "user", "content": validate_prompt}]
-
-        completion = client.chat.completions.create(
-            model="meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo",
-            messages=messages,
-            max_tokens=1024,
+def _listings_text(items: List[ValidateItem]) -> str:
+    return "\n\n".join([
+        f"Item description: {item.description}\n"
+        f"Price: {item.price}\n"
+        f"Listed price: {item.listedprice}\n"
+        f"Message: {item.message}\n"
+        f"Date published: {item.datepublished}\n"
+        f"URL: {item.url}" for item in items
+    ])
+
+
+async def _validate_with_llm(request_text: str,
+                             items: List[ValidateItem],
+                             compact: bool = False,
+                             reasoning: bool = False) -> List[ValidatedItem]:
+    if compact:
+        # Numbered listings in, [id, verdict] pairs out; reasoning only on
+        # request since output tokens dominate latency
+        messages = [{
+            "role":
+            "user",
+            "content":
+            compact_protocol.validate_prompt(request_text, items, reasoning)
+        }]
+        validate_response = await gateway.complete(
+            messages,
+            max_tokens=(40 if reasoning else 12) * len(items) + 16,
+            temperature=0,
+            top_p=0.7)
+        return [
+            ValidatedItem(**verdict) for verdict in
+            compact_protocol.parse_verdicts(validate_response, items)
+        ]
+
+    validate_prompt = VALIDATE_PROMPT_TEMPLATE.format(
+        request=request_text, listings=_listings_text(items))
+
+    messages = [{"role": "user", "content": validate_prompt}]
+
+    validate_response = await gateway.complete(messages,
+                                               max_tokens=1024,
+                                               temperature=0,
+                                               top_p=0.7)
+
+    # Parse the response into ValidatedItem objects
+    return parse_list(validate_response, ValidatedItem)
+
+
+async def _validate_batch_with_llm(key: tuple, batch: list) -> list:
+    """Validate several callers' (request, items) in one completion.
+
+    Returns one verdict list per caller, or None for a caller that got no
+    verdicts back, which the batcher then retries on its own.
+    """
+    compact, reasoning = key
+    total = sum(len(items) for _, items in batch)
+    if compact:
+        messages = [{
+            "role": "user",
+            "content": compact_protocol.batch_validate_prompt(batch, reasoning)
+        }]
+        validate_response = await gateway.complete(
+            messages,
+            max_tokens=(40 if reasoning else 12) * total + 16,
             temperature=0,
-            top_p=0.7,
-            top_k=50,
-            repetition_penalty=1,
-        )
+            top_p=0.7)
+        per_request = [[
+            ValidatedItem(**verdict) for verdict in verdicts
+        ] for verdicts in compact_protocol.parse_batch_verdicts(
+            validate_response, batch)]
+    else:
+        requests_text = "\n\n".join(
+            f"Request {i}: {request_text}\nListings:\n{_listings_text(items)}"
+            for i, (request_text, items) in enumerate(batch, 1))
+        messages = [{
+            "role":
+            "user",
+            "content":
+            VALIDATE_BATCH_PROMPT_TEMPLATE.format(requests=requests_text)
+        }]
+        validate_response = await gateway.complete(
+            messages,
+            max_tokens=min(4096, max(1024, 100 * total)),
+            temperature=0,
+            top_p=0.7)
+        per_request = [[] for _ in batch]
+        for verdict in parse_list(validate_response, BatchValidatedItem):
+            if 1 <= verdict.request <= len(batch):
+                per_request[verdict.request - 1].append(
+                    ValidatedItem(**verdict.model_dump(exclude={"request"})))
+    return [verdicts or None for verdicts in per_request]
+
+
+validation_batcher = MicroBatcher(
+    _validate_batch_with_llm,
+    lambda key, payload: _validate_with_llm(*payload, *key),
+    window=VALIDATE_BATCH_WINDOW_MS / 1000,
+    token_budget=VALIDATE_BATCH_TOKEN_BUDGET)
+
+
+def _validate_template(compact: bool, reasoning: bool) -> str:
+    if not compact:
+        template = VALIDATE_PROMPT_TEMPLATE
+    else:
+        template = VALIDATE_COMPACT_PROMPT_TEMPLATE + (
+            VALIDATE_COMPACT_REASONING if reasoning else "")
+    if cascade.enabled("validate"):
+        # Cascaded verdicts are cached apart from single-model ones
+        template += f"\ncascade:{cascade.SMALL_MODEL}:{cascade.MIN_CONFIDENCE}"
+    return template
+
+
+async def _validate_items(request_text: str, items: List[ValidateItem],
+                         template: str, compact: bool,
+                         reasoning: bool) -> List[ValidatedItem]:
+    # Reuse stored per-listing verdicts and only send unseen or changed
+    # listings to the model
+    keys = [
+        verdict_key(DEFAULT_MODEL, template, request_text, item.url,
+                    item.price, item.description)
+        for item in items
+    ]
+    verdicts = {}
+    unseen_items = []
+    for key, item in zip(keys, items):
+        verdict = verdict_cache.get(key)
+        if verdict is not None:
+            verdicts[key] = verdict
+        else:
+            unseen_items.append((key, item))
+
+    if unseen_items:
+        new_items = [item for _, item in unseen_items]
+        new_verdicts = {}
+        if cascade.enabled("validate"):
+            # Confident small-model verdicts stand; only the rest reach the
+            # large model. Outside the compact protocol the large model
+            # writes each first message, so relevant listings go on too
+            triaged, new_items = await cascade.triage_listings(
+                request_text, new_items, escalate_relevant=not compact)
+            new_verdicts.update(
+                {verdict["item_id"]: ValidatedItem(**verdict)
+                 for verdict in triaged})
+        if new_items:
+            start = time.perf_counter()
+            # Merged with other callers' validation work arriving meanwhile
+            new_verdicts.update({
+                verdict.item_id: verdict
+                for verdict in await validation_batcher.submit(
+                    (compact, reasoning), (request_text, new_items),
+                    estimate_tokens(_listings_text(new_items)))
+            })
+            if cascade.enabled("validate"):
+                cascade.record("validate", "large",
+                               time.perf_counter() - start, len(new_items), 0)
+        for key, item in unseen_items:
+            verdict = new_verdicts.get(item.url)
+            if verdict is not None:
+                verdict_cache.set(key, verdict)
+                verdicts[key] = verdict
+
+    return [verdicts[key] for key in keys if key in verdicts]
+
+
+async def _validate(request: ValidateRequest, compact: bool,
+                    reasoning: bool) -> tuple:
+    """Validate a batch, returning (ValidateResponse, prefilter report)."""
+    template = _validate_template(compact, reasoning)
+    cache_key = make_key(DEFAULT_MODEL, template, request.model_dump())
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, None
+
+    minprice, maxprice = await _price_window(request.searchid,
+                                             request.minprice,
+                                             request.maxprice)
+    kept, prefilter_report = prefilter(
+        request.request, [item.model_dump() for item in request.items],
+        minprice, maxprice)
+    request.items = [ValidateItem(**item) for item in kept]
+
+    validated_items = await _validate_items(request.request, request.items,
+                                            template, compact, reasoning)
+    validate_result = ValidateResponse(validated_items=validated_items)
+    # A listing the model dropped or garbled has no verdict yet; caching the
+    # whole response would keep it from ever being re-sent
+    if len(validated_items) == len(request.items):
+        response_cache.set(cache_key, validate_result)
+    return validate_result, prefilter_report
 
-        validate_response = completion.choices[0].message.content
 
-        # Parse the response
-        parsed_response = json.loads(validate_response)
+@app.post("/validate", response_model=ValidateResponse)
+async def validate_endpoint(request: ValidateRequest,
+                            response: Response,
+                            compact: bool = compact_protocol.COMPACT_DEFAULT,
+                            reasoning: bool = False):
+    try:
+        validate_result, prefilter_report = await _validate(
+            request, compact, reasoning)
+        if prefilter_report is not None:
+            response.headers["X-Prefilter-Report"] = json.dumps(
+                prefilter_report)
+        return validate_result
+
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except json.JSONDecodeError as json_error:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Invalid JSON response from LLM: {str(json_error)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Convert the parsed response to ValidatedItem objects
-        validated_items = [ValidatedItem(**item) for item in parsed_response]
 
-        return ValidateResponse(validated_items=validated_items)
+async def _validation_job(request: ValidateRequest, compact: bool,
+                          reasoning: bool) -> dict:
+    # _validate narrows request.items, so every attempt gets a fresh copy
+    validate_result, prefilter_report = await _validate(
+        request.model_copy(deep=True), compact, reasoning)
+    return {
+        **validate_result.model_dump(), "prefilter_report": prefilter_report
+    }
+
+
+# Asynchronous validation: submit returns a job id straight away, the result
+# is fetched by polling (or long-polling with ?wait=) the job
+@app.post("/validate/jobs", status_code=202)
+async def submit_validation_job(
+        request: ValidateRequest,
+        priority: int = Query(0, ge=-10, le=10),
+        compact: bool = compact_protocol.COMPACT_DEFAULT,
+        reasoning: bool = False):
+    try:
+        job = validation_jobs.submit(
+            "validate", lambda: _validation_job(request, compact, reasoning),
+            priority)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job.job_id, "status": job.status}
+
+
+@app.get("/validate/jobs/{job_id}")
+async def get_validation_job(job_id: str, wait: float = Query(0, ge=0,
+                                                              le=60)):
+    job = await validation_jobs.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.delete("/validate/jobs/{job_id}")
+async def cancel_validation_job(job_id: str):
+    job = validation_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+# Match a batch of new listings against every saved search in one pass;
+# with validate=true only the candidate (search, listing) pairs are validated
+@app.post("/percolate")
+async def percolate(request: PercolateRequest,
+                    validate: bool = False,
+                    compact: bool = compact_protocol.COMPACT_DEFAULT):
+    try:
+        matches = search_index.match(
+            [item.model_dump() for item in request.items])
+        results = []
+        for search_id, indexes in matches.items():
+            search = search_index.searches[search_id]
+            results.append({
+                "searchid": search_id,
+                "userid": search["userid"],
+                "searchitem": search["searchitem"],
+                "items": [request.items[i].url for i in indexes],
+            })
+        if validate and results:
+            # Concurrent, so the micro-batcher can merge the searches
+            requests = [
+                ValidateRequest(request=search_index.searches[search_id]
+                                ["searchitem"],
+                                items=[request.items[i] for i in indexes],
+                                searchid=search_id)
+                for search_id, indexes in matches.items()
+            ]
+            validated = await asyncio.gather(
+                *(_validate(r, compact, False) for r in requests))
+            for result, (validate_result, _) in zip(results, validated):
+                result["validated_items"] = validate_result.validated_items
+        return {
+            "matches": results,
+            "report": {
+                "listings": len(request.items),
+                "searches": len(search_index.searches),
+                "candidate_pairs": sum(len(i) for i in matches.values()),
+            }
+        }
 
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except json.JSONDecodeError as json_error:
         raise HTTPException(
             status_code=500,
@@ -416,56 +886,467 @@ async def validate_endpoint(request: ValidateRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _pipeline_events(request: PipelineRequest, compact: bool,
+                           reasoning: bool):
+    minprice, maxprice = await _price_window(request.searchid,
+                                             request.minprice,
+                                             request.maxprice)
+    kept, prefilter_report = prefilter(
+        request.request, [item.model_dump() for item in request.items],
+        minprice, maxprice)
+    yield json.dumps({"type": "prefilter", "report": prefilter_report}) + "\n"
+    template = _validate_template(compact, reasoning)
+
+    async def rank(shard: list) -> list:
+        by_url = {item['url']: item for item in shard}
+        return [
+            by_url[url]
+            for url in await rank_shard(request.request, shard, compact)
+        ]
+
+    async def validate(listings: list) -> list:
+        verdicts = await _validate_items(
+            request.request, [ValidateItem(**item) for item in listings],
+            template, compact, reasoning)
+        by_url = {item['url']: item for item in listings}
+        rows = []
+        for verdict in verdicts:
+            item = by_url.get(verdict.item_id)
+            if not verdict.relevant or item is None:
+                continue
+            rows.append({
+                "description": item['description'],
+                "searchid": request.searchid,
+                "url": item['url'],
+                "image": item['image'],
+                "message": verdict.first_message,
+                "itemsearch": request.request,
+                "listedprice": item['listedprice'],
+                "estimateprice": item['price'],
+                "minprice": minprice,
+                "maxprice": maxprice,
+                "datepublished": item['datepublished'],
+            })
+        return rows
+
+    async def persist(rows: list) -> dict:
+        async with app.state.db_pool.acquire() as conn:
+            return await upsert_items(conn, rows)
+
+    shards = shard_listings(
+        kept, COMPACT_SHARD_TOKEN_BUDGET if compact else SHARD_TOKEN_BUDGET)
+    async for event in Pipeline(rank, validate, persist).run(shards):
+        yield json.dumps(event, default=str) + "\n"
+
+
+# Scrape to stored viables in one call: replaces /rank, /validate and POST
+# /viables round trips, with the stages overlapping and progress streamed
+# as NDJSON.
+@app.post("/pipeline")
+async def pipeline_endpoint(request: PipelineRequest,
+                            compact: bool = compact_protocol.COMPACT_DEFAULT,
+                            reasoning: bool = False):
+    return StreamingResponse(_pipeline_events(request, compact, reasoning),
+                             media_type="application/x-ndjson")
+
+
+def _negotiation_reply(bot_response: str) -> dict:
+    reply = parse_object(bot_response)
+    # The prompt's examples use "message" instead of "content"
+    if 'content' not in reply and 'message' in reply:
+        reply['content'] = reply.pop('message')
+    try:
+        validated = NegotiationResponse(**reply)
+    except ValidationError as e:
+        structured_output.stats["failed"] += 1
+        raise StructuredOutputError(f"Invalid negotiation reply: {e}",
+                                    bot_response, 0)
+    return {"role": reply.get("role", "assistant"), **validated.model_dump()}
+
+
+def _last_seller_message(chat_history: list) -> str:
+    for message in reversed(chat_history):
+        if message.get('role') != 'assistant':
+            return message.get('content', '')
+    return ""
+
+
+def _fast_reply(chat_history: list, users_goal: str, context: str):
+    # Only when the seller has the last word; our previous message gives
+    # the offer a bare "sure" agrees to
+    if not chat_history or chat_history[-1].get('role') == 'assistant':
+        return None
+    last_offer = next((message.get('content', '')
+                       for message in reversed(chat_history)
+                       if message.get('role') == 'assistant'), "")
+    return fastpath.reply(chat_history[-1].get('content', ''), users_goal,
+                          last_offer, context)
+
+
+def _negotiation_messages(request_json: dict) -> list:
+    # Construct the conversation history
+    # conversation_history = "\n".join(
+    #     [f"{msg['role']}: {msg['content']}" for msg in request_json['chat_history']])
+    # print(conversation_history)
+    context = request_json['context']
+    item_description = request_json['item_description']
+    conversation_history = request_json['chat_history']
+    negotiation_prompt = NEGOTIATION_PROMPT_TEMPLATE.format(
+        context=context,
+        users_goal=item_description,
+        conversation_history=conversation_history)
+    return [{"role": "user", "content": negotiation_prompt}]
+
+
 @app.post("/chat")
 async def chat_endpoint(request: Request):
     try:
         request_json = await request.json()
-        print("Parsed request:", request_json)
-        print(request_json.keys())
-        # Construct the conversation history
-        # conversation_history = "\n".join(
-        #     [f"{msg['role']}: {msg['content']}" for msg in request_json['chat_history']])
-        # print(conversation_history)
-        context = request_json['context']
-        item_description = request_json['item_description']
-        conversation_history=request_json['chat_history']
-        negotiation_prompt = NEGOTIATION_PROMPT_TEMPLATE.format(
-            context=context,
-            users_goal=item_description,
-            conversation_history=conversation_history)
-
-        messages = [{"role": "user", "content": negotiation_prompt}]
-        print(messages)
-        completion = client.chat.completions.create(
-            model="meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo",
-            messages=messages,
-            max_tokens=1024,
-            temperature=0.7,
-            top_p=0.9,
-            top_k=50,
-            repetition_penalty=1,
-        )
-
-        bot_response = completion.choices[0].message.content
-        logging.info(f"AI Response: {bot_response}")
-        print("raw reponse", bot_response)
-        # Parse the JSON response
-        negotiation_response = json.loads(bot_response)
+        logger.debug("Parsed request", extra={"payload": request_json})
+        negotiation_response = _fast_reply(request_json['chat_history'],
+                                           request_json['item_description'],
+                                           request_json['context'])
+        if negotiation_response is not None:
+            bot_response = json.dumps(negotiation_response)
+        else:
+            messages = _negotiation_messages(request_json)
+            # Price-committing turns always get the large model
+            bot_response, negotiation_response = await cascade.negotiate(
+                messages,
+                _negotiation_reply,
+                _last_seller_message(request_json['chat_history']),
+                max_tokens=1024,
+                temperature=0.7,
+                top_p=0.9)
+        logger.info("AI Response: %s", bot_response)
 
         # Check if this is an ending message
         conversation_ended = is_ending_message(negotiation_response['content'])
-        print(negotiation_response)
         return negotiation_response
 
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except json.JSONDecodeError as json_error:
         raise HTTPException(
             status_code=500,
             detail=f"Invalid JSON response from bot: {str(json_error)}")
     except Exception as e:
-        logging.error(f"Error in chat endpoint: {e}")
+        logger.exception("Error in chat endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _fast_event_stream(reply: dict):
+    logger.info("AI Response: %s", json.dumps(reply))
+    yield sse_event("token", {"text": reply['content']})
+    conversation_ended = is_ending_message(reply['content'])
+    if conversation_ended:
+        yield sse_event("ending", {})
+    yield sse_event("done", {
+        "content": reply['content'],
+        "conversation_ended": conversation_ended
+    })
+
+
+async def _chat_event_stream(messages: list):
+    parser = ContentFieldParser()
+    conversation_ended = False
+    try:
+        # Always the large model, even with LLM_CASCADE=chat: the cascade
+        # can only judge a draft once it is complete (see cascade.negotiate)
+        # aclosing: breaking out closes the upstream response (and frees the
+        # provider slot) now rather than whenever the generator is collected
+        async with aclosing(
+                gateway.stream(messages,
+                               max_tokens=1024,
+                               temperature=0.7,
+                               top_p=0.9)) as deltas:
+            async for delta in deltas:
+                text = parser.feed(delta)
+                if text:
+                    yield sse_event("token", {"text": text})
+                    # Let the client wind the session down as soon as the
+                    # closing line shows up
+                    if not conversation_ended and is_ending_message(
+                            parser.content):
+                        conversation_ended = True
+                        yield sse_event("ending", {})
+                # The seller-facing text is complete, so stop generating
+                # instead of waiting for the reasoning field
+                if parser.done:
+                    break
+    except Exception as e:
+        logger.exception("Error in chat stream: %s", e)
+        yield sse_event("error", {"detail": str(e)})
+        return
+
+    if not parser.done and not parser.content:
+        try:
+            extract_json(parser.buffer, expect=dict)
+        except StructuredOutputError:
+            # No JSON envelope at all; the raw text is the reply
+            pass
+        else:
+            # JSON without a content field: never show its other fields
+            # (reasoning included) to the seller
+            yield sse_event("error",
+                            {"detail": "Reply has no content field"})
+            return
+        parser.content = parser.buffer.strip()
+        yield sse_event("token", {"text": parser.content})
+        conversation_ended = is_ending_message(parser.content)
+    logger.info("AI Response: %s", json.dumps({
+        "role": "assistant",
+        "content": parser.content
+    }))
+    yield sse_event("done", {
+        "content": parser.content,
+        "conversation_ended": conversation_ended
+    })
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: Request):
+    try:
+        request_json = await request.json()
+        fast_reply = _fast_reply(request_json['chat_history'],
+                                 request_json['item_description'],
+                                 request_json['context'])
+        messages = _negotiation_messages(request_json)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    events = (_fast_event_stream(fast_reply) if fast_reply is not None else
+              _chat_event_stream(messages))
+    return StreamingResponse(events,
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+async def _load_session(session_id: str, fresh: bool = False):
+    # Sessions live in Postgres so they survive restarts and are shared by
+    # workers; the LRU in front saves the round trip on reads. `fresh`
+    # skips it where the session is about to be changed, since another
+    # worker may have added turns since this one cached it.
+    session = None if fresh else session_store.get(session_id)
+    if session is None:
+        async with app.state.db_pool.acquire() as conn:
+            state = await repository.load_session(conn, session_id,
+                                                  SESSION_TTL)
+        if state is None:
+            session_store.delete(session_id)
+            return None
+        session = NegotiationSession.from_state(state)
+        session_store.set(session_id, session)
+    return session
+
+
+async def _save_session(session: NegotiationSession):
+    async with app.state.db_pool.acquire() as conn:
+        await repository.save_session(conn, session.session_id,
+                                      session.to_state())
+    session_store.set(session.session_id, session)
+
+
+@app.post("/sessions")
+async def create_session(request: SessionCreate):
+    session_id = session_id_for(request.item_id, request.seller)
+    session = await _load_session(session_id)
+    if session is None:
+        session = NegotiationSession(session_id, request.context,
+                                     request.item_description)
+        for msg in request.chat_history:
+            session.add(msg.role, msg.content)
+        await _save_session(session)
+    return session.to_dict()
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    session = await _load_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session.to_dict()
+
+
+async def _session_reply(session: NegotiationSession, message: str) -> tuple:
+    """Reply to a new seller message; returns (raw text, reply)."""
+    last_offer = next((turn['content'] for turn in reversed(session.recent)
+                       if turn['role'] == 'assistant'), "")
+    negotiation_response = fastpath.reply(message, session.users_goal,
+                                          last_offer, session.context)
+    if negotiation_response is not None:
+        return json.dumps(negotiation_response), negotiation_response
+    negotiation_prompt = NEGOTIATION_PROMPT_TEMPLATE.format(
+        context=session.context,
+        users_goal=session.users_goal,
+        conversation_history=session.conversation_history() +
+        f"\nseller: {message}")
+    messages = [{"role": "user", "content": negotiation_prompt}]
+    return await cascade.negotiate(messages,
+                                   _negotiation_reply,
+                                   message,
+                                   max_tokens=1024,
+                                   temperature=0.7,
+                                   top_p=0.9)
+
+
+@app.post("/sessions/{session_id}/chat")
+async def session_chat(session_id: str, request: SessionMessage):
+    session = await _load_session(session_id, fresh=True)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        # Only the new seller message comes from the client; the transcript
+        # and its rolling summary live here. The message is recorded once the
+        # reply succeeds so a retry doesn't repeat it.
+        bot_response, negotiation_response = await _session_reply(
+            session, request.message)
+        logger.info("Seller: %s", request.message)
+        logger.info("AI Response: %s", bot_response)
+        content = negotiation_response['content']
+        session.add("seller", request.message)
+        session.add("assistant", content)
+        session.ended = is_ending_message(content)
+        await _save_session(session)
+        return {
+            "response": negotiation_response,
+            "conversation_ended": session.ended
+        }
+
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except json.JSONDecodeError as json_error:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Invalid JSON response from bot: {str(json_error)}")
+    except Exception as e:
+        logger.exception("Error in session chat: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    async with app.state.db_pool.acquire() as conn:
+        await repository.delete_session(conn, session_id)
+    session_store.delete(session_id)
+    return {"deleted": session_id}
+
+
+async def _orchestrated_reply(session: NegotiationSession, message: str):
+    bot_response, negotiation_response = await _session_reply(
+        session, message)
+    logger.info("Seller: %s", message)
+    logger.info("AI Response: %s", bot_response)
+    return negotiation_response, is_ending_message(
+        negotiation_response['content'])
+
+
+negotiations = orchestrator.Orchestrator(_orchestrated_reply)
+
+
+class NegotiationStart(BaseModel):
+    searchid: int
+    # Defaults to the saved search's item and max price
+    users_goal: Optional[str] = None
+    # Defaults to the search's first ORCHESTRATOR_MAX_SELLERS items
+    item_ids: Optional[List[int]] = None
+
+
+def _price_text(value) -> str:
+    return f"${float(value):g}" if value is not None else "an unlisted price"
+
+
+# Negotiate with every seller of a saved search at once. Outgoing messages
+# are polled from GET /negotiations/{searchid} (after= the last delivered
+# seq) and seller replies posted to .../sellers/{item_id}.
+@app.post("/negotiations", status_code=202)
+async def start_negotiations(request: NegotiationStart):
+    try:
+        async with app.state.db_pool.acquire() as conn:
+            search = await repository.fetch_search(conn, request.searchid)
+            if search is None:
+                raise HTTPException(status_code=404,
+                                    detail="Search not found")
+            rows = await fetch_items_page(
+                conn,
+                request.searchid,
+                1000 if request.item_ids else
+                orchestrator.ORCHESTRATOR_MAX_SELLERS,
+                fields=("description", "message", "listedprice"))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if request.item_ids:
+        wanted = set(request.item_ids)
+        rows = [row for row in rows if row["id"] in wanted]
+    if not rows:
+        raise HTTPException(status_code=404, detail="Item not found")
+    users_goal = request.users_goal or (
+        f"I want to buy {search['searchitem']} for "
+        f"{_price_text(search['maxprice'])}")
+    items = [{
+        "item_id": row["id"],
+        "context": (f"The seller is selling {row['description']}, listed at "
+                    f"{_price_text(row['listedprice'])}"),
+        "message": row["message"],
+    } for row in rows]
+    return negotiations.start(request.searchid, users_goal, items).to_dict()
+
+
+@app.get("/negotiations/{searchid}")
+async def get_negotiations(searchid: int,
+                           after: int = Query(0, ge=0),
+                           wait: float = Query(0, ge=0, le=60)):
+    search = negotiations.get(searchid)
+    if search is None:
+        raise HTTPException(status_code=404, detail="Negotiation not found")
+    search.acknowledge(after)
+    await search.wait(after, wait)
+    return search.to_dict(after)
+
+
+@app.post("/negotiations/{searchid}/sellers/{item_id}", status_code=202)
+async def seller_message(searchid: int, item_id: int,
+                         request: SessionMessage):
+    search = negotiations.get(searchid)
+    if search is None:
+        raise HTTPException(status_code=404, detail="Negotiation not found")
+    try:
+        return search.receive(item_id, request.message).to_dict()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Seller not found")
+
+
+@app.delete("/negotiations/{searchid}")
+async def stop_negotiations(searchid: int):
+    search = negotiations.stop(searchid)
+    if search is None:
+        raise HTTPException(status_code=404, detail="Negotiation not found")
+    return search.to_dict()
+
+
+@app.get("/cache_stats")
+async def cache_stats():
+    return {
+        "responses": response_cache.stats(),
+        "verdicts": verdict_cache.stats(),
+        "llm_coalescing": gateway.inflight.stats(),
+        "validation_batching": validation_batcher.stats(),
+        "cascade": cascade.stats,
+        "negotiation_fast_path": fastpath.report(),
+        "negotiations": negotiations.stats(),
+        "search_index": search_index.stats()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition of the in-process metrics."""
+    return PlainTextResponse(metrics.render(),
+                             media_type="text/plain; version=0.0.4")
+
+
 def is_ending_message(message: str) -> bool:
     ending_patterns = [r"thank you,?\s+all the best", r"amazing,?\s+thank you"]
     return any(
@@ -473,6 +1354,8 @@ def is_ending_message(message: str) -> bool:
         for pattern in ending_patterns)
 
 
+startup.mark("imports")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,246 @@
+import bisect
+import contextvars
+import time
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+
+# Route template of the request being handled, so LLM, parser and pool
+# metrics can be attributed to the endpoint that caused them.
+current_route = contextvars.ContextVar("current_route", default="none")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions."""
+
+    def __init__(self, name: str, help: str, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            # Per-bucket counts (last slot is +Inf), sum
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf", ), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Read at scrape time from a callback returning {label values: value}."""
+
+    def __init__(self, name: str, help: str, labelnames=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} gauge"]
+        for key, value in (self.collect() if self.collect else {}).items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = register(
+    Histogram("http_request_duration_seconds",
+              "Time until the response starts, per route.",
+              ("route", "method", "status")))
+llm_request_duration = register(
+    Histogram("llm_request_duration_seconds",
+              "LLM completion latency (full response).",
+              ("route", "model", "provider", "mode", "outcome")))
+llm_time_to_first_token = register(
+    Histogram("llm_time_to_first_token_seconds",
+              "Time from request to the first streamed token.",
+              ("route", "model", "provider")))
+llm_prompt_tokens = register(
+    Counter("llm_prompt_tokens_total", "Prompt tokens sent to the model.",
+            ("route", "model")))
+llm_completion_tokens = register(
+    Counter("llm_completion_tokens_total",
+            "Completion tokens received from the model.", ("route", "model")))
+json_parse_total = register(
+    Counter("llm_json_parse_total",
+            "Structured output parses by outcome (parsed, recovered, "
+            "failed, invalid_items).", ("route", "outcome")))
+db_pool_acquire_wait = register(
+    Histogram("db_pool_acquire_wait_seconds",
+              "Time spent waiting for a pooled database connection.",
+              ("route", ),
+              buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                       0.25, 0.5, 1, 5)))
+db_pool_connections = register(
+    Gauge("db_pool_connections", "Database pool connections by state.",
+          ("state", )))
+
+
+def estimate_tokens(text: str) -> int:
+    # Same rough 4-characters-per-token rule the ranking shards use
+    return len(text or "") // 4 + 1
+
+
+def record_usage(model: str, messages: list, completion: str, usage=None):
+    """Count tokens, from the provider's usage block when it sent one."""
+    route = current_route.get()
+    if usage is not None and getattr(usage, "prompt_tokens", None):
+        prompt_tokens = usage.prompt_tokens
+        completion_tokens = usage.completion_tokens or 0
+    else:
+        prompt_tokens = sum(
+            estimate_tokens(m.get("content")) for m in messages)
+        completion_tokens = estimate_tokens(completion)
+    llm_prompt_tokens.inc(prompt_tokens, route=route, model=model)
+    llm_completion_tokens.inc(completion_tokens, route=route, model=model)
+
+
+class MetricsRoute(APIRoute):
+    """APIRoute that times each request under its path template."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request):
+            # Left set for the rest of the request task so streamed bodies,
+            # which run after the handler returns, keep their route label
+            current_route.set(path)
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            finally:
+                http_request_duration.observe(time.perf_counter() - start,
+                                              route=path,
+                                              method=request.method,
+                                              status=status)
+
+        return timed_handler
+
+
+class _TimedAcquire:
+
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+
+    async def _acquire(self):
+        start = time.perf_counter()
+        conn = await self._pool.acquire(timeout=self._timeout)
+        db_pool_acquire_wait.observe(time.perf_counter() - start,
+                                     route=current_route.get())
+        return conn
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._acquire()
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        await self._pool.release(self._conn)
+
+
+class InstrumentedPool:
+    """Wraps an asyncpg pool to time acquire() in both of its call styles
+    (`await pool.acquire()` and `async with pool.acquire()`)."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        db_pool_connections.collect = self._connections
+
+    def acquire(self, *, timeout=None):
+        return _TimedAcquire(self._pool, timeout)
+
+    def _connections(self) -> dict:
+        if not getattr(self._pool, "ready", True):
+            # Still opening in the background
+            return {}
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        return {
+            ("in_use", ): size - idle,
+            ("idle", ): idle,
+            ("max", ): self._pool.get_max_size(),
+        }
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
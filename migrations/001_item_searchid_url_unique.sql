@@ -0,0 +1,10 @@
+-- Bulk POST /viables upserts on (searchid, url), which needs a unique index.
+-- Keep the newest row of any existing duplicates before creating it.
+DELETE FROM item a
+USING item b
+WHERE a.searchid = b.searchid
+  AND a.url = b.url
+  AND a.id < b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS item_searchid_url_key
+    ON item (searchid, url);
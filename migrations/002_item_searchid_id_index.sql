@@ -0,0 +1,4 @@
+-- Keyset pagination and streaming of GET /viables read item by
+-- (searchid, id); this index serves both the filter and the ordering.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS item_searchid_id_idx
+    ON item (searchid, id);
@@ -0,0 +1,7 @@
+-- /sessions transcripts, so they survive restarts and are shared by every
+-- worker. state is NegotiationSession.to_state().
+CREATE TABLE IF NOT EXISTS negotiation_session (
+    session_id text PRIMARY KEY,
+    state jsonb NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,286 @@
+import asyncio
+import itertools
+import logging
+import os
+import re
+import time
+
+import metrics
+from fastpath import DECLINE_MESSAGE, agreed_price, goal_price
+from sessions import NegotiationSession
+
+# Replies generated at once across every running search.
+ORCHESTRATOR_MAX_CONCURRENCY = int(
+    os.getenv("ORCHESTRATOR_MAX_CONCURRENCY", "8"))
+ORCHESTRATOR_MAX_SELLERS = int(os.getenv("ORCHESTRATOR_MAX_SELLERS", "12"))
+# Replies one search may generate, shared by all of its sellers.
+ORCHESTRATOR_TURN_BUDGET = int(os.getenv("ORCHESTRATOR_TURN_BUDGET", "60"))
+# What happens to the other sellers once one deal is struck: "stop" sends
+# them the closing line, "downgrade" keeps them open as silent backups.
+ORCHESTRATOR_ON_DEAL = os.getenv("ORCHESTRATOR_ON_DEAL", "stop")
+DEFAULT_OPENING = "Hi, is this still available?"
+
+ACCEPTANCE_PATTERN = re.compile(r"amazing,?\s+thank you", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+negotiation_outcomes = metrics.register(
+    metrics.Counter("negotiation_seller_outcomes_total",
+                    "Orchestrated seller negotiations by final status.",
+                    ("status", )))
+time_to_deal = metrics.register(
+    metrics.Histogram("negotiation_time_to_deal_seconds",
+                      "Time from starting a search's negotiations to a deal.",
+                      buckets=(1, 10, 60, 300, 900, 3600, 4 * 3600,
+                               24 * 3600)))
+
+# "accepted" is a seller we said yes to without them confirming one total;
+# it doesn't count as the search's deal, so the other sellers carry on.
+FINISHED = ("deal", "accepted", "ended", "stopped", "backup")
+
+
+class SellerNegotiation:
+    """One seller's side of a search: transcript plus a few counters."""
+    __slots__ = ("item_id", "session", "status", "inbox", "task", "turns",
+                 "deal_price")
+
+    def __init__(self, item_id, session: NegotiationSession):
+        self.item_id = item_id
+        self.session = session
+        self.status = "open"
+        self.inbox = asyncio.Queue()
+        self.task = None
+        self.turns = 0
+        self.deal_price = None
+
+    def to_dict(self) -> dict:
+        return {
+            "item_id": self.item_id,
+            "status": self.status,
+            "turns": self.turns,
+            "deal_price": self.deal_price,
+            "pending_seller_messages": self.inbox.qsize(),
+        }
+
+
+class SearchNegotiation:
+    """Every seller negotiation for one saved search, run concurrently.
+
+    Outgoing messages (openers, replies, closing lines) are numbered per
+    search; clients poll for the ones after the last number they delivered
+    and post seller replies back per item. The first seller to explicitly
+    agree to one total at or below the goal (offering just that price, or
+    saying yes to our offer of it) wins: the others are stopped or
+    downgraded, and no further replies are generated once the shared turn
+    budget is spent.
+    """
+
+    def __init__(self, searchid: int, users_goal: str, respond, semaphore,
+                 turn_budget: int = ORCHESTRATOR_TURN_BUDGET,
+                 on_deal: str = ORCHESTRATOR_ON_DEAL):
+        self.searchid = searchid
+        self.users_goal = users_goal
+        self.goal = goal_price(users_goal)
+        self.respond = respond
+        self.semaphore = semaphore
+        self.turn_budget = turn_budget
+        self.on_deal = on_deal
+        self.sellers = {}
+        self.outbox = []
+        self.deal = None
+        self.started_at = time.time()
+        self.changed = asyncio.Event()
+        self._sequence = itertools.count(1)
+
+    def start(self, items: list):
+        """`items` are dicts with item_id, context and an opening message."""
+        for item in items:
+            session = NegotiationSession(f"{self.searchid}:{item['item_id']}",
+                                         item["context"], self.users_goal)
+            seller = SellerNegotiation(item["item_id"], session)
+            self.sellers[seller.item_id] = seller
+            opening = item.get("message") or DEFAULT_OPENING
+            session.add("assistant", opening)
+            self._send(seller, opening)
+            seller.task = asyncio.create_task(self._run(seller))
+
+    @property
+    def finished(self) -> bool:
+        return all(seller.status in FINISHED
+                   for seller in self.sellers.values())
+
+    def receive(self, item_id, message: str):
+        seller = self.sellers.get(item_id)
+        if seller is None:
+            raise KeyError(item_id)
+        if seller.status != "open":
+            # Kept for whoever picks the conversation up by hand
+            seller.session.add("seller", message)
+            return seller
+        seller.inbox.put_nowait(message)
+        return seller
+
+    def _send(self, seller: SellerNegotiation, content: str):
+        self.outbox.append({
+            "seq": next(self._sequence),
+            "item_id": seller.item_id,
+            "content": content
+        })
+        self.changed.set()
+
+    def acknowledge(self, after: int):
+        # Delivered messages are dropped; the transcripts keep the text
+        self.outbox = [m for m in self.outbox if m["seq"] > after]
+
+    def messages_after(self, after: int) -> list:
+        return [m for m in self.outbox if m["seq"] > after]
+
+    async def _run(self, seller: SellerNegotiation):
+        while seller.status == "open":
+            message = await seller.inbox.get()
+            if seller.status != "open":
+                break
+            if self.turn_budget <= 0:
+                self._finish(seller, "stopped", DECLINE_MESSAGE)
+                break
+            self.turn_budget -= 1
+            last_offer = next(
+                (turn["content"] for turn in reversed(seller.session.recent)
+                 if turn["role"] == "assistant"), "")
+            try:
+                async with self.semaphore:
+                    reply, ended = await self.respond(seller.session, message)
+            except Exception as e:
+                # The seller's message stays unanswered; a re-post retries it
+                logger.warning("Negotiation reply for item %s failed: %s",
+                               seller.item_id, e)
+                self.turn_budget += 1
+                continue
+            seller.turns += 1
+            content = reply["content"]
+            seller.session.add("seller", message)
+            seller.session.add("assistant", content)
+            self._send(seller, content)
+            if ended:
+                price = agreed_price(message, last_offer, self.goal)
+                if not ACCEPTANCE_PATTERN.search(content):
+                    self._finish(seller, "ended")
+                elif price is not None:
+                    self._close_deal(seller, price)
+                else:
+                    self._finish(seller, "accepted")
+
+    def _close_deal(self, seller: SellerNegotiation, price: float):
+        seller.deal_price = price
+        self._finish(seller, "deal")
+        if self.deal is not None:
+            return
+        self.deal = {"item_id": seller.item_id, "price": price}
+        time_to_deal.observe(time.time() - self.started_at)
+        for other in self.sellers.values():
+            if other is seller or other.status in FINISHED:
+                continue
+            if self.on_deal == "downgrade":
+                self._finish(other, "backup")
+            else:
+                self._finish(other, "stopped", DECLINE_MESSAGE)
+
+    def _finish(self, seller: SellerNegotiation, status: str,
+                closing: str = None):
+        if seller.status in FINISHED:
+            return
+        seller.status = status
+        negotiation_outcomes.inc(status=status)
+        if closing is not None:
+            seller.session.add("assistant", closing)
+            self._send(seller, closing)
+        if seller.task is not None and seller.task is not asyncio.current_task():
+            seller.task.cancel()
+        self.changed.set()
+
+    def stop(self):
+        for seller in self.sellers.values():
+            self._finish(seller, "stopped")
+
+    async def wait(self, after: int, timeout: float):
+        """Long-poll until there are messages after `after` or it's over."""
+        deadline = time.monotonic() + timeout
+        while not self.messages_after(after) and not self.finished:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+    def to_dict(self, after: int = 0) -> dict:
+        return {
+            "searchid": self.searchid,
+            "users_goal": self.users_goal,
+            "deal": self.deal,
+            "turn_budget_left": self.turn_budget,
+            "finished": self.finished,
+            "sellers": [seller.to_dict() for seller in self.sellers.values()],
+            "messages": self.messages_after(after),
+        }
+
+
+class Orchestrator:
+    """Running searches by searchid, sharing one reply concurrency cap.
+
+    `respond(session, seller_message)` produces the reply for one turn and
+    returns (reply dict, conversation ended).
+    """
+
+    def __init__(self, respond,
+                 max_concurrency: int = ORCHESTRATOR_MAX_CONCURRENCY):
+        self.respond = respond
+        self.max_concurrency = max_concurrency
+        self.searches = {}
+        self._semaphore = None
+
+    def start(self, searchid: int, users_goal: str, items: list,
+              **options) -> SearchNegotiation:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        previous = self.searches.get(searchid)
+        if previous is not None:
+            previous.stop()
+        search = SearchNegotiation(searchid, users_goal, self.respond,
+                                   self._semaphore, **options)
+        self.searches[searchid] = search
+        search.start(items[:ORCHESTRATOR_MAX_SELLERS])
+        return search
+
+    def get(self, searchid: int):
+        return self.searches.get(searchid)
+
+    def stop(self, searchid: int):
+        search = self.searches.pop(searchid, None)
+        if search is not None:
+            search.stop()
+        return search
+
+    async def close(self):
+        tasks = [
+            seller.task for search in self.searches.values()
+            for seller in search.sellers.values() if seller.task is not None
+        ]
+        for search in self.searches.values():
+            search.stop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.searches.clear()
+
+    def stats(self) -> dict:
+        statuses = {}
+        for search in self.searches.values():
+            for seller in search.sellers.values():
+                statuses[seller.status] = statuses.get(seller.status, 0) + 1
+        return {
+            "searches": len(self.searches),
+            "deals": sum(search.deal is not None
+                         for search in self.searches.values()),
+            "sellers": statuses,
+        }
@@ -0,0 +1,110 @@
+import os
+from collections import Counter
+
+from prefilter import PRICE_SLACK, tokenize
+
+# Share of a search's terms a listing has to contain to be a candidate.
+MIN_TERM_MATCH = float(os.getenv("PERCOLATE_MIN_TERM_MATCH", "0.5"))
+
+
+def _singular(token: str) -> str:
+    # Just enough for plural and singular listings to hit the same search
+    if len(token) <= 3 or not token.endswith("s") or token.endswith("ss"):
+        return token
+    if token.endswith(("ches", "shes", "xes", "sses", "zes")):
+        return token[:-2]
+    return token[:-1]
+
+
+def _terms(text: str) -> set:
+    return {_singular(token) for token in tokenize(text)}
+
+
+def _price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SearchIndex:
+    """Inverted index of the saved searches in item_search.
+
+    Listings are matched against every search at once: a listing's terms
+    pull the candidate searches from the postings, and only those are
+    checked for term coverage and price window. Cost per listing scales
+    with the searches sharing its terms, not with all saved searches.
+    """
+
+    def __init__(self, min_term_match: float = MIN_TERM_MATCH,
+                 slack: float = PRICE_SLACK):
+        self.min_term_match = min_term_match
+        self.slack = slack
+        self.searches = {}
+        self.postings = {}
+
+    def load(self, rows):
+        self.searches.clear()
+        self.postings.clear()
+        for row in rows:
+            self.add(row)
+        return len(rows)
+
+    def add(self, row):
+        search_id = row["id"]
+        self.remove(search_id)
+        terms = _terms(row["searchitem"])
+        self.searches[search_id] = {
+            "id": search_id,
+            "userid": row["userid"],
+            "searchitem": row["searchitem"],
+            "minprice": _price(row["minprice"]),
+            "maxprice": _price(row["maxprice"]),
+            "terms": terms,
+        }
+        for term in terms:
+            self.postings.setdefault(term, set()).add(search_id)
+
+    def remove(self, search_id):
+        search = self.searches.pop(search_id, None)
+        if search is None:
+            return
+        for term in search["terms"]:
+            ids = self.postings.get(term)
+            if ids is not None:
+                ids.discard(search_id)
+                if not ids:
+                    del self.postings[term]
+
+    def _in_price_window(self, search: dict, price) -> bool:
+        if price is None:
+            return True
+        if search["minprice"] is not None and price < search["minprice"] * (
+                1 - self.slack):
+            return False
+        if search["maxprice"] is not None and price > search["maxprice"] * (
+                1 + self.slack):
+            return False
+        return True
+
+    def match(self, items: list) -> dict:
+        """Map search id -> indexes of the listings that are candidates."""
+        matches = {}
+        for index, item in enumerate(items):
+            hits = Counter()
+            for term in _terms(item.get("description")):
+                hits.update(self.postings.get(term, ()))
+            price = _price(item.get("price"))
+            for search_id, count in hits.items():
+                search = self.searches[search_id]
+                if count < self.min_term_match * len(search["terms"]):
+                    continue
+                if self._in_price_window(search, price):
+                    matches.setdefault(search_id, []).append(index)
+        return matches
+
+    def stats(self) -> dict:
+        return {"searches": len(self.searches), "terms": len(self.postings)}
+
+
+search_index = SearchIndex()
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+
+# Ranked shards waiting for validation; ranking pauses once this many pile up.
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+PIPELINE_VALIDATE_WORKERS = int(os.getenv("PIPELINE_VALIDATE_WORKERS", "4"))
+# Relevant rows are written in batches of up to this many...
+PIPELINE_PERSIST_BATCH = int(os.getenv("PIPELINE_PERSIST_BATCH", "25"))
+# ...or whatever has arrived this long after the first row of a batch.
+PIPELINE_PERSIST_WINDOW_MS = float(
+    os.getenv("PIPELINE_PERSIST_WINDOW_MS", "200"))
+
+DONE = object()
+
+logger = logging.getLogger(__name__)
+
+time_to_first_item = metrics.register(
+    metrics.Histogram("pipeline_time_to_first_item_seconds",
+                      "Time from pipeline start to the first persisted item."))
+
+
+class Pipeline:
+    """Rank, validate and persist listing shards as overlapping stages.
+
+    Shards are ranked concurrently and each ranked shard goes straight to
+    the validation workers through a bounded queue, so validating the first
+    shard overlaps ranking the rest. Relevant rows go through a second
+    bounded queue to a single writer that persists them in batches. `run()`
+    yields progress events as each stage completes a piece of work.
+
+    `rank(shard)` returns the shard's listings worth validating, in order,
+    `validate(listings)` the rows to persist and `persist(rows)` the
+    {"inserted", "updated"} counts. A failing shard or batch is reported as
+    an error event and the rest carry on.
+    """
+
+    def __init__(self,
+                 rank,
+                 validate,
+                 persist,
+                 queue_size: int = PIPELINE_QUEUE_SIZE,
+                 workers: int = PIPELINE_VALIDATE_WORKERS,
+                 batch_size: int = PIPELINE_PERSIST_BATCH,
+                 window: float = PIPELINE_PERSIST_WINDOW_MS / 1000):
+        self.rank = rank
+        self.validate = validate
+        self.persist = persist
+        self.queue_size = queue_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.window = window
+
+    async def run(self, shards: list):
+        start = time.perf_counter()
+        events = asyncio.Queue()
+        ranked = asyncio.Queue(self.queue_size)
+        rows = asyncio.Queue(self.batch_size * 4)
+        summary = {
+            "shards": len(shards),
+            "ranked": 0,
+            "validated": 0,
+            "relevant": 0,
+            "inserted": 0,
+            "updated": 0,
+            "errors": 0,
+            "first_item_ms": None,
+        }
+
+        def elapsed_ms() -> float:
+            return round((time.perf_counter() - start) * 1000, 1)
+
+        async def error(stage: str, detail, **fields):
+            summary["errors"] += 1
+            logger.warning("Pipeline %s failed: %s", stage, detail)
+            await events.put({
+                "type": "error",
+                "stage": stage,
+                "detail": str(detail),
+                **fields
+            })
+
+        async def rank_shard(index: int, shard: list):
+            try:
+                listings = await self.rank(shard)
+            except Exception as e:
+                await error("rank", e, shard=index)
+                return
+            summary["ranked"] += len(listings)
+            await events.put({
+                "type": "ranked",
+                "shard": index,
+                "listings": len(listings),
+                "ms": elapsed_ms()
+            })
+            if listings:
+                # Waits here while validation is behind
+                await ranked.put((index, listings))
+
+        async def rank_stage():
+            await asyncio.gather(*(rank_shard(index, shard)
+                                   for index, shard in enumerate(shards)))
+            for _ in range(self.workers):
+                await ranked.put(DONE)
+
+        async def validate_worker():
+            while (entry := await ranked.get()) is not DONE:
+                index, listings = entry
+                try:
+                    relevant = await self.validate(listings)
+                except Exception as e:
+                    await error("validate", e, shard=index)
+                    continue
+                summary["validated"] += len(listings)
+                summary["relevant"] += len(relevant)
+                await events.put({
+                    "type": "validated",
+                    "shard": index,
+                    "validated": len(listings),
+                    "relevant": [row.get("url") for row in relevant],
+                    "ms": elapsed_ms()
+                })
+                for row in relevant:
+                    await rows.put(row)
+
+        async def validate_stage():
+            await asyncio.gather(*(validate_worker()
+                                   for _ in range(self.workers)))
+            await rows.put(DONE)
+
+        async def flush(batch: list):
+            try:
+                counts = await self.persist(batch)
+            except Exception as e:
+                await error("persist", e, rows=len(batch))
+                return
+            if summary["first_item_ms"] is None:
+                summary["first_item_ms"] = elapsed_ms()
+                time_to_first_item.observe(summary["first_item_ms"] / 1000)
+            summary["inserted"] += counts["inserted"]
+            summary["updated"] += counts["updated"]
+            await events.put({
+                "type": "persisted",
+                **counts,
+                "urls": [row.get("url") for row in batch],
+                "ms": elapsed_ms()
+            })
+
+        async def persist_stage():
+            loop = asyncio.get_running_loop()
+            finished = False
+            while not finished:
+                row = await rows.get()
+                if row is DONE:
+                    break
+                batch = [row]
+                deadline = loop.time() + self.window
+                while len(batch) < self.batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(rows.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if row is DONE:
+                        finished = True
+                        break
+                    batch.append(row)
+                await flush(batch)
+
+        async def supervise():
+            try:
+                await asyncio.gather(rank_stage(), validate_stage(),
+                                     persist_stage())
+            finally:
+                await events.put(DONE)
+
+        task = asyncio.create_task(supervise())
+        try:
+            while (event := await events.get()) is not DONE:
+                yield event
+            await task
+        finally:
+            # The client went away mid-run: stop every stage
+            task.cancel()
+        yield {"type": "done", **summary, "ms": elapsed_ms()}
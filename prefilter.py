@@ -0,0 +1,125 @@
+import math
+import os
+import re
+from collections import Counter
+
+# Listings priced within this fraction outside the search's price window are
+# kept, since the asking price is usually negotiable.
+PRICE_SLACK = float(os.getenv("PREFILTER_PRICE_SLACK", "0.2"))
+# Listings scoring at or below this are dropped. Off by default: a listing
+# sharing no word with the request (0) may still be a synonym match, which
+# is the model's call. Set 0 to drop those.
+MIN_SCORE = float(os.getenv("PREFILTER_MIN_SCORE", "-1"))
+# At most this many listings are sent on to the model.
+TOP_N = int(os.getenv("PREFILTER_TOP_N", "50"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from i im in is it its looking me my "
+    "of on or so that the this to want with".split())
+
+
+def tokenize(text: str) -> list:
+    return [
+        token for token in TOKEN_PATTERN.findall((text or "").lower())
+        if token not in STOPWORDS
+    ]
+
+
+def _price(item: dict):
+    try:
+        return float(item.get("price"))
+    except (TypeError, ValueError):
+        return None
+
+
+def filter_price_window(items: list, minprice=None, maxprice=None,
+                        slack: float = PRICE_SLACK) -> list:
+    if minprice is None and maxprice is None:
+        return items
+    low = minprice * (1 - slack) if minprice is not None else -math.inf
+    high = maxprice * (1 + slack) if maxprice is not None else math.inf
+    kept = []
+    for item in items:
+        price = _price(item)
+        # Listings without a usable price are left for the model to judge.
+        if price is None or low <= price <= high:
+            kept.append(item)
+    return kept
+
+
+def dedupe_urls(items: list) -> list:
+    seen, kept = set(), []
+    for item in items:
+        url = item.get("url")
+        if url and url in seen:
+            continue
+        seen.add(url)
+        kept.append(item)
+    return kept
+
+
+def bm25_scores(query: str, items: list) -> list:
+    """Score each listing's description against the query with Okapi BM25."""
+    docs = [tokenize(item.get("description", "")) for item in items]
+    if not docs:
+        return []
+    avg_len = sum(len(doc) for doc in docs) / len(docs) or 1
+    doc_freq = Counter(term for doc in docs for term in set(doc))
+    query_terms = set(tokenize(query))
+
+    scores = []
+    for doc in docs:
+        term_freq = Counter(doc)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_len)
+        score = 0.0
+        for term in query_terms:
+            tf = term_freq.get(term)
+            if not tf:
+                continue
+            df = doc_freq[term]
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+
+def prefilter(query: str,
+              items: list,
+              minprice=None,
+              maxprice=None,
+              top_n: int = TOP_N,
+              min_score: float = MIN_SCORE,
+              slack: float = PRICE_SLACK):
+    """Cheap in-process filtering of listings before they reach the model.
+
+    BM25 only orders the listings (ties keep their original order) before the
+    cut to `top_n`, unless `min_score` is raised to 0 or above. Returns the
+    surviving listings, best lexical match first, together with
+    a report of how many listings each step removed.
+    """
+    report = {"received": len(items)}
+
+    priced = filter_price_window(items, minprice, maxprice, slack)
+    report["price_window"] = len(items) - len(priced)
+
+    unique = dedupe_urls(priced)
+    report["duplicates"] = len(priced) - len(unique)
+
+    if tokenize(query):
+        scored = [(score, item)
+                  for score, item in zip(bm25_scores(query, unique), unique)
+                  if score > min_score]
+    else:
+        # Nothing to match on; keep everything in its original order.
+        scored = [(0.0, item) for item in unique]
+    report["irrelevant"] = len(unique) - len(scored)
+
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    kept = [item for _, item in scored[:top_n]]
+    report["top_n"] = len(scored) - len(kept)
+    report["kept"] = len(kept)
+    return kept, report
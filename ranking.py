@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+
+import compact as compact_protocol
+from llm_gateway import gateway
+from structured_output import extract_json
+from Prompts.BrowsingAgent import RANK_PROMPT_TEMPLATE
+
+# Listing text per shard, sized so the echoed JSON array still fits in the
+# 1024-token completion.
+SHARD_TOKEN_BUDGET = int(os.getenv("RANK_SHARD_TOKEN_BUDGET", "700"))
+# The compact protocol only returns ids, so its shards can be much larger.
+COMPACT_SHARD_TOKEN_BUDGET = int(
+    os.getenv("RANK_COMPACT_SHARD_TOKEN_BUDGET", "3000"))
+# How many of each shard's best listings go into the final re-rank.
+SHARD_WINNERS = int(os.getenv("RANK_SHARD_WINNERS", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting prompts.
+    return len(text) // 4 + 1
+
+
+def format_listing(item: dict) -> str:
+    return (f"Item description: {item.get('description', 'N/A')}\n"
+            f"Price: {item.get('price', 'N/A')}\n"
+            f"url: {item.get('url', 'N/A')}")
+
+
+def shard_listings(items: list, token_budget: int = SHARD_TOKEN_BUDGET):
+    shards = []
+    current, current_tokens = [], 0
+    for item in items:
+        tokens = estimate_tokens(format_listing(item))
+        if current and current_tokens + tokens > token_budget:
+            shards.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        shards.append(current)
+    return shards
+
+
+async def rank_shard(request: str, items: list, compact: bool = False) -> list:
+    """Rank one shard of listings and return the relevant urls in order."""
+    if compact:
+        # Numbered listings in, ordered ids out
+        messages = [{
+            "role": "user",
+            "content": compact_protocol.rank_prompt(request, items)
+        }]
+        rank_response = await gateway.complete(messages,
+                                               max_tokens=256,
+                                               temperature=0,
+                                               top_p=0.7)
+        logger.debug("Raw AI response", extra={"payload": rank_response})
+        return compact_protocol.parse_rank(rank_response, items)
+
+    listings_text = "\n\n".join(format_listing(item) for item in items)
+    rank_prompt = RANK_PROMPT_TEMPLATE.format(request=request,
+                                              listings=listings_text)
+    messages = [{"role": "user", "content": rank_prompt}]
+    rank_response = await gateway.complete(messages,
+                                           max_tokens=1024,
+                                           temperature=0,
+                                           top_p=0.7)
+    logger.debug("Raw AI response", extra={"payload": rank_response})
+
+    known_urls = {item.get('url') for item in items}
+    return [
+        item['url'] for item in extract_json(rank_response, expect=list)
+        if isinstance(item, dict) and item.get('url') in known_urls
+    ]
+
+
+def merge_shard_rankings(shard_rankings: list) -> list:
+    # Interleave the shards rank by rank so no single shard dominates the
+    # provisional order.
+    merged, seen = [], set()
+    for rank in range(max((len(r) for r in shard_rankings), default=0)):
+        for ranking in shard_rankings:
+            if rank < len(ranking) and ranking[rank] not in seen:
+                seen.add(ranking[rank])
+                merged.append(ranking[rank])
+    return merged
+
+
+async def rank_sharded_stream(request: str,
+                              items: list,
+                              token_budget: int = None,
+                              winners: int = SHARD_WINNERS,
+                              compact: bool = False):
+    """Rank listings shard by shard, yielding progress as shards finish.
+
+    Yields {"type": "partial", ...} events with the provisional top urls after
+    each shard and a final {"type": "final", "urls": [...]} event once the
+    shard winners have been re-ranked against each other.
+    """
+    if token_budget is None:
+        token_budget = (COMPACT_SHARD_TOKEN_BUDGET
+                        if compact else SHARD_TOKEN_BUDGET)
+    shards = shard_listings(items, token_budget)
+    if len(shards) <= 1:
+        urls = await rank_shard(request, items, compact) if items else []
+        yield {"type": "final", "urls": urls}
+        return
+
+    async def run(index, shard):
+        return index, await rank_shard(request, shard, compact)
+
+    shard_rankings = [[] for _ in shards]
+    tasks = [
+        asyncio.create_task(run(i, shard)) for i, shard in enumerate(shards)
+    ]
+    try:
+        for done, next_task in enumerate(asyncio.as_completed(tasks), 1):
+            index, urls = await next_task
+            shard_rankings[index] = urls
+            yield {
+                "type": "partial",
+                "shard": index,
+                "shards_done": done,
+                "shards_total": len(shards),
+                "urls": merge_shard_rankings(
+                    [r[:winners] for r in shard_rankings]),
+            }
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    # Final small re-rank of each shard's winners; everything else keeps its
+    # interleaved shard order behind them.
+    by_url = {item.get('url'): item for item in items}
+    finalists = merge_shard_rankings([r[:winners] for r in shard_rankings])
+    finalists = shard_listings([by_url[url] for url in finalists],
+                               token_budget)[:1]
+    finalists = finalists[0] if finalists else []
+    final = (await rank_shard(request, finalists, compact)
+             if finalists else [])
+    rejected = {item.get('url') for item in finalists} - set(final)
+    final += [
+        url for url in merge_shard_rankings(shard_rankings)
+        if url not in final and url not in rejected
+    ]
+    yield {"type": "final", "urls": final}
+
+
+async def rank_listings(request: str, items: list,
+                        compact: bool = False) -> list:
+    urls = []
+    async for event in rank_sharded_stream(request, items, compact=compact):
+        if event["type"] == "final":
+            urls = event["urls"]
+    return urls
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import os
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Idle connections above min_size are closed after this many seconds.
+DB_POOL_MAX_INACTIVE_LIFETIME = float(
+    os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+# Connections are recycled after this many queries.
+DB_POOL_MAX_QUERIES = int(os.getenv("DB_POOL_MAX_QUERIES", "50000"))
+# Server-side statement timeout per connection (0 = none).
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Prepared statements kept per connection by asyncpg.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "bargain-for-me")
+# Requests arriving while the pool is still opening wait this long for it.
+DB_POOL_READY_TIMEOUT = float(os.getenv("DB_POOL_READY_TIMEOUT", "30"))
+
+ITEM_COLUMNS = ("description", "searchid", "url", "image", "message",
+                "itemsearch", "listedprice", "estimateprice", "minprice",
+                "maxprice", "datepublished")
+
+
+async def upsert_items(conn, items: list) -> dict:
+    """Insert or update a batch of items in one transaction.
+
+    Rows are streamed into a temporary table over COPY and merged into item
+    with a single INSERT ... ON CONFLICT (searchid, url), so a batch costs a
+    handful of round trips regardless of its size and either lands entirely
+    or not at all. Duplicate (searchid, url) pairs within the batch keep the
+    last occurrence.
+    """
+    rows = {}
+    for item in items:
+        rows[(item.get("searchid"), item.get("url"))] = tuple(
+            item.get(column) for column in ITEM_COLUMNS)
+    if not rows:
+        return {"inserted": 0, "updated": 0}
+
+    columns = ", ".join(ITEM_COLUMNS)
+    async with conn.transaction():
+        await conn.execute(f"""
+            CREATE TEMP TABLE item_ingest ON COMMIT DROP AS
+            SELECT {columns} FROM item WITH NO DATA
+        """)
+        await conn.copy_records_to_table("item_ingest",
+                                         records=list(rows.values()),
+                                         columns=ITEM_COLUMNS)
+        result = await conn.fetchrow(f"""
+            WITH upserted AS (
+                INSERT INTO item ({columns})
+                SELECT {columns} FROM item_ingest
+                ON CONFLICT (searchid, url) DO UPDATE SET {_ITEM_UPDATES}
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT count(*) FILTER (WHERE inserted) AS inserted,
+                   count(*) FILTER (WHERE NOT inserted) AS updated
+            FROM upserted
+        """)
+    return {"inserted": result["inserted"], "updated": result["updated"]}
+
+
+ITEM_FIELDS = ("id", ) + ITEM_COLUMNS
+
+_ITEM_COLUMN_LIST = ", ".join(ITEM_COLUMNS)
+_ITEM_UPDATES = ", ".join(f"{column} = EXCLUDED.{column}"
+                          for column in ITEM_COLUMNS
+                          if column not in ("searchid", "url"))
+
+# Hot statements. Each is sent as the same text every time, so asyncpg
+# prepares it once per connection and reuses it from its statement cache.
+STATEMENTS = {
+    "insert_search": """
+        INSERT INTO item_search (userid, searchitem, minprice, maxprice)
+        VALUES ($1, $2, $3, $4)
+        RETURNING id, userid, searchitem, minprice, maxprice
+    """,
+    "insert_item": f"""
+        INSERT INTO item ({_ITEM_COLUMN_LIST})
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+        ON CONFLICT (searchid, url) DO UPDATE SET {_ITEM_UPDATES}
+        RETURNING id, {_ITEM_COLUMN_LIST}
+    """,
+    "search_price_window":
+    "SELECT minprice, maxprice FROM item_search WHERE id = $1",
+    "fetch_search":
+    "SELECT id, userid, searchitem, minprice, maxprice FROM item_search "
+    "WHERE id = $1",
+    "fetch_searches":
+    "SELECT id, userid, searchitem, minprice, maxprice FROM item_search",
+    "has_items": "SELECT EXISTS (SELECT 1 FROM item WHERE searchid = $1)",
+    "load_session": """
+        SELECT state FROM negotiation_session
+        WHERE session_id = $1
+          AND updated_at > now() - make_interval(secs => $2)
+    """,
+    "save_session": """
+        INSERT INTO negotiation_session (session_id, state, updated_at)
+        VALUES ($1, $2::jsonb, now())
+        ON CONFLICT (session_id)
+        DO UPDATE SET state = EXCLUDED.state, updated_at = now()
+    """,
+    "delete_session":
+    "DELETE FROM negotiation_session WHERE session_id = $1",
+}
+# Read-only statements run once (with arguments matching nothing) when a
+# connection opens, so requests find them already prepared.
+WARM_STATEMENTS = {"search_price_window": (0, ), "has_items": (0, )}
+
+
+async def _init_connection(conn):
+    import asyncpg
+    for name, args in WARM_STATEMENTS.items():
+        try:
+            await conn.fetch(STATEMENTS[name], *args)
+        except asyncpg.PostgresError:
+            # Missing table on a fresh database; prepared on first use
+            pass
+
+
+async def create_pool(dsn: str):
+    """Pool sized and tuned from the DB_POOL_* settings.
+
+    min_size connections are opened (and warmed by _init_connection) before
+    this returns, so the first requests don't pay for connecting.
+    """
+    # Imported here so the app can start serving before asyncpg is loaded
+    import asyncpg
+    server_settings = {"application_name": DB_APPLICATION_NAME}
+    if DB_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+    return await asyncpg.create_pool(
+        dsn,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        max_queries=DB_POOL_MAX_QUERIES,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        init=_init_connection,
+        server_settings=server_settings)
+
+
+class DeferredPool:
+    """Stands in for the pool while open() creates it in the background.
+
+    The app can then accept requests (and answer /ready) straight away;
+    acquire() waits up to DB_POOL_READY_TIMEOUT for the first attempt, then
+    fails at once with the last error until a later open() succeeds.
+    """
+
+    def __init__(self, ready_timeout: float = DB_POOL_READY_TIMEOUT):
+        self.ready_timeout = ready_timeout
+        self.pool = None
+        self.error = None
+        self._opened = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.pool is not None
+
+    async def open(self, dsn: str):
+        try:
+            self.pool = await create_pool(dsn)
+            self.error = None
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self._opened.set()
+
+    async def _wait(self):
+        if self.pool is None:
+            try:
+                await asyncio.wait_for(self._opened.wait(), self.ready_timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError("Database pool is still opening")
+        if self.pool is None:
+            raise RuntimeError(f"Database pool failed to open: {self.error}")
+        return self.pool
+
+    async def acquire(self, *, timeout=None):
+        return await (await self._wait()).acquire(timeout=timeout)
+
+    async def release(self, conn):
+        await self.pool.release(conn)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+    def __getattr__(self, name):
+        pool = self.__dict__.get("pool")
+        if pool is None:
+            raise AttributeError(name)
+        return getattr(pool, name)
+
+
+async def server_version(conn) -> str:
+    return await conn.fetchval("SELECT version();")
+
+
+async def insert_search(conn, userid, searchitem, minprice, maxprice):
+    return await conn.fetchrow(STATEMENTS["insert_search"], userid,
+                               searchitem, minprice, maxprice)
+
+
+async def fetch_search(conn, searchid: int):
+    return await conn.fetchrow(STATEMENTS["fetch_search"], searchid)
+
+
+async def fetch_searches(conn) -> list:
+    return await conn.fetch(STATEMENTS["fetch_searches"])
+
+
+async def search_price_window(conn, searchid: int):
+    return await conn.fetchrow(STATEMENTS["search_price_window"], searchid)
+
+
+async def insert_item(conn, item: dict):
+    return await conn.fetchrow(STATEMENTS["insert_item"],
+                               *(item[column] for column in ITEM_COLUMNS))
+
+
+async def load_session(conn, session_id: str, ttl: float):
+    """Stored session state, or None if missing or idle longer than ttl."""
+    state = await conn.fetchval(STATEMENTS["load_session"], session_id,
+                                float(ttl))
+    return json.loads(state) if state is not None else None
+
+
+async def save_session(conn, session_id: str, state: dict):
+    await conn.execute(STATEMENTS["save_session"], session_id,
+                       json.dumps(state))
+
+
+async def delete_session(conn, session_id: str):
+    await conn.execute(STATEMENTS["delete_session"], session_id)
+
+
+def item_projection(fields=None) -> str:
+    # id is always selected since the keyset cursor is built from it
+    fields = [f for f in (fields or ITEM_FIELDS) if f != "id"]
+    unknown = set(fields) - set(ITEM_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown item fields: {', '.join(sorted(unknown))}")
+    return ", ".join(("id", *fields))
+
+
+async def has_items(conn, searchid: int) -> bool:
+    return await conn.fetchval(STATEMENTS["has_items"], searchid)
+
+
+async def fetch_items_page(conn,
+                           searchid: int,
+                           limit: int,
+                           after_id: int = None,
+                           fields=None) -> list:
+    """One keyset page of a search's items, ordered by id."""
+    query = f"""
+        SELECT {item_projection(fields)} FROM item
+        WHERE searchid = $1 AND id > $2
+        ORDER BY id
+        LIMIT $3
+    """
+    return await conn.fetch(query, searchid, after_id or 0, limit)
+
+
+async def iter_items(conn,
+                     searchid: int,
+                     after_id: int = None,
+                     fields=None,
+                     prefetch: int = 500):
+    """Stream a search's items through a server-side cursor.
+
+    Only `prefetch` rows are held in memory at a time, however many rows the
+    search has.
+    """
+    query = f"""
+        SELECT {item_projection(fields)} FROM item
+        WHERE searchid = $1 AND id > $2
+        ORDER BY id
+    """
+    async with conn.transaction():
+        async for row in conn.cursor(query,
+                                     searchid,
+                                     after_id or 0,
+                                     prefetch=prefetch):
+            yield row
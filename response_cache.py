@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+
+def template_version(template: str) -> str:
+    # Editing a prompt template changes its version and so invalidates any
+    # responses cached for the old wording.
+    return hashlib.sha256(template.encode()).hexdigest()[:12]
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_key(model: str, template: str, payload) -> str:
+    blob = json.dumps(
+        {
+            "model": model,
+            "template": template_version(template),
+            "payload": _normalize(payload),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class TTLCache:
+    """Bounded in-memory cache with LRU eviction and a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def values(self) -> list:
+        """Unexpired values, without touching hit counts or LRU order."""
+        now = time.monotonic()
+        return [value for expires_at, value in self._data.values()
+                if expires_at >= now]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+response_cache = TTLCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+
+# Per-listing validation verdicts, so repeat polls only validate new listings.
+verdict_cache = TTLCache(
+    max_entries=int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "20000")),
+    ttl=float(os.getenv("VERDICT_CACHE_TTL", "86400")),
+)
+
+
+def verdict_key(model: str, template: str, request: str, url: str,
+                price: float, description: str) -> str:
+    description_hash = hashlib.sha256(
+        _normalize(description).encode()).hexdigest()
+    return make_key(model, template, {
+        "request": request,
+        "url": url,
+        "price": price,
+        "description": description_hash,
+    })
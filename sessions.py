@@ -0,0 +1,146 @@
+import hashlib
+import os
+import re
+import time
+
+from response_cache import TTLCache
+
+# Turns kept word for word at the end of the prompt; older ones are folded
+# into the rolling summary.
+KEEP_RECENT_TURNS = int(os.getenv("SESSION_KEEP_RECENT_TURNS", "6"))
+# Folded turns listed individually in the summary before only the price
+# history is kept for them.
+SUMMARY_MAX_LINES = int(os.getenv("SESSION_SUMMARY_MAX_LINES", "8"))
+SUMMARY_LINE_CHARS = 120
+PRICE_HISTORY_MAX = 6
+
+PRICE_PATTERN = re.compile(
+    r"\$\s?(\d[\d,]*(?:\.\d+)?)|(\d[\d,]*(?:\.\d+)?)\s*(?:dollars|bucks)\b",
+    re.IGNORECASE)
+
+
+def extract_prices(text: str) -> list:
+    prices = []
+    for match in PRICE_PATTERN.finditer(text or ""):
+        value = (match.group(1) or match.group(2)).replace(",", "")
+        try:
+            prices.append(float(value))
+        except ValueError:
+            continue
+    return prices
+
+
+def session_id_for(item_id: str, seller: str) -> str:
+    return hashlib.sha256(f"{item_id}\0{seller}".encode()).hexdigest()[:16]
+
+
+class NegotiationSession:
+    """Transcript of one negotiation, kept small enough to re-prompt with.
+
+    The newest turns stay verbatim, as does the latest offer made by each
+    side; everything older is folded into a short summary line per turn and,
+    once those run out, into the price history only. Prompt size therefore
+    stays bounded however long the haggle runs.
+    """
+
+    def __init__(self, session_id: str, context: str, users_goal: str):
+        self.session_id = session_id
+        self.context = context
+        self.users_goal = users_goal
+        self.recent = []
+        self.summary = []
+        self.folded_turns = 0
+        self.price_history = {"seller": [], "assistant": []}
+        self.latest_offers = {}
+        self.ended = False
+        self.updated_at = time.time()
+
+    def add(self, role: str, content: str):
+        turn = {"role": role, "content": content}
+        prices = extract_prices(content)
+        if prices:
+            history = self.price_history.setdefault(role, [])
+            history.extend(prices)
+            del history[:-PRICE_HISTORY_MAX]
+            self.latest_offers[role] = turn
+        self.recent.append(turn)
+        self.updated_at = time.time()
+        while len(self.recent) > KEEP_RECENT_TURNS:
+            self._fold(self.recent.pop(0))
+
+    def _fold(self, turn: dict):
+        line = f"{turn['role']}: {turn['content']}"
+        if len(line) > SUMMARY_LINE_CHARS:
+            line = line[:SUMMARY_LINE_CHARS - 3] + "..."
+        self.summary.append(line)
+        self.folded_turns += 1
+        del self.summary[:-SUMMARY_MAX_LINES]
+
+    def conversation_history(self) -> str:
+        parts = []
+        if self.folded_turns:
+            parts.append(
+                f"Summary of the {self.folded_turns} earlier messages:")
+            for role, prices in self.price_history.items():
+                if prices:
+                    trail = " -> ".join(f"${p:g}" for p in prices)
+                    parts.append(f"- {role} prices so far: {trail}")
+            if self.folded_turns > len(self.summary):
+                parts.append(f"- ({self.folded_turns - len(self.summary)} "
+                             "older messages omitted)")
+            parts.extend(f"- {line}" for line in self.summary)
+            older_offers = [
+                turn for turn in self.latest_offers.values()
+                if turn not in self.recent
+            ]
+            if older_offers:
+                parts.append("Latest offers:")
+                parts.extend(f"{turn['role']}: {turn['content']}"
+                             for turn in older_offers)
+            parts.append("Recent messages:")
+        parts.extend(f"{turn['role']}: {turn['content']}"
+                     for turn in self.recent)
+        return "\n".join(parts)
+
+    def to_state(self) -> dict:
+        """Everything needed to rebuild the session with from_state()."""
+        return {
+            "session_id": self.session_id,
+            "context": self.context,
+            "users_goal": self.users_goal,
+            "recent": self.recent,
+            "summary": self.summary,
+            "folded_turns": self.folded_turns,
+            "price_history": self.price_history,
+            "latest_offers": self.latest_offers,
+            "ended": self.ended,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "NegotiationSession":
+        session = cls(state["session_id"], state["context"],
+                      state["users_goal"])
+        for key in ("recent", "summary", "folded_turns", "price_history",
+                    "latest_offers", "ended", "updated_at"):
+            setattr(session, key, state[key])
+        return session
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "context": self.context,
+            "users_goal": self.users_goal,
+            "folded_turns": self.folded_turns,
+            "conversation_history": self.conversation_history(),
+            "ended": self.ended,
+            "updated_at": self.updated_at,
+        }
+
+
+# Sessions are kept in Postgres; this is the read-through cache in front.
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+session_store = TTLCache(
+    max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+    ttl=SESSION_TTL,
+)
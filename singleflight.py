@@ -0,0 +1,53 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key onto one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it
+    runs wait on the same task and get its result or its exception. A
+    waiter that is cancelled only stops waiting, but once every waiter is
+    gone the shared task is cancelled too, so nobody pays for a completion
+    no one will read.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def do(self, key, factory):
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(factory())
+            call = self._calls[key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(call["task"])
+        except asyncio.CancelledError:
+            if not call["task"].done() and call["waiters"] == 1:
+                call["task"].cancel()
+                self._forget(key, call["task"])
+                self.cancelled += 1
+            raise
+        finally:
+            call["waiters"] -= 1
+
+    def _forget(self, key, task):
+        call = self._calls.get(key)
+        if call is not None and call["task"] is task:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,42 @@
+import time
+
+# Imported first thing by main, so this is as close to process start as the
+# app can measure without reading /proc.
+STARTED = time.perf_counter()
+
+# Phase -> seconds. "imports", "ready" and "first_request" are measured from
+# STARTED; "pool_open" and "llm_handshake" are the phases' own durations.
+phases = {}
+
+
+def mark(phase: str, since: float = STARTED) -> float:
+    phases[phase] = time.perf_counter() - since
+    return phases[phase]
+
+
+def phase_seconds() -> dict:
+    return {(phase, ): seconds for phase, seconds in phases.items()}
+
+
+def report() -> dict:
+    return {f"{phase}_ms": round(seconds * 1000, 1)
+            for phase, seconds in phases.items()}
+
+
+class FirstRequestMiddleware:
+    """Record when the first response starts going out."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "first_request" in phases:
+            return await self.app(scope, receive, send)
+
+        async def send_timed(message):
+            if (message["type"] == "http.response.start"
+                    and "first_request" not in phases):
+                mark("first_request")
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
@@ -0,0 +1,80 @@
+import json
+import re
+
+# The negotiation prompt asks for "content" but its examples use "message";
+# either key carries the text meant for the seller.
+CONTENT_KEY_PATTERN = re.compile(r'[{,]\s*"(?:content|message)"\s*:\s*"')
+
+ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class ContentFieldParser:
+    """Pull the "content" string out of a JSON envelope as it streams in.
+
+    feed() takes raw completion deltas and returns whatever new, decoded
+    content text they completed. Every other field, reasoning included, is
+    skipped. `done` turns true once the closing quote of the content string
+    has been seen.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.content = ""
+        self.done = False
+        self._start = None
+        self._pos = 0
+
+    def feed(self, delta: str) -> str:
+        self.buffer += delta
+        if self.done:
+            return ""
+        if self._start is None:
+            match = CONTENT_KEY_PATTERN.search(self.buffer)
+            if match is None:
+                return ""
+            self._start = self._pos = match.end()
+
+        out = []
+        buffer, pos = self.buffer, self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char != "\\":
+                out.append(char)
+                pos += 1
+                continue
+            # Wait for the rest of an escape sequence split across deltas
+            if pos + 1 >= len(buffer):
+                break
+            escape = buffer[pos + 1]
+            if escape == "u":
+                if pos + 6 > len(buffer):
+                    break
+                try:
+                    out.append(chr(int(buffer[pos + 2:pos + 6], 16)))
+                except ValueError:
+                    out.append(buffer[pos:pos + 6])
+                pos += 6
+            else:
+                out.append(ESCAPES.get(escape, escape))
+                pos += 2
+        self._pos = pos
+        text = "".join(out)
+        self.content += text
+        return text
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
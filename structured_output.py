@@ -0,0 +1,144 @@
+import json
+import re
+
+from pydantic import BaseModel, ValidationError
+
+import metrics
+
+_decoder = json.JSONDecoder()
+_START = re.compile(r"[\[{]")
+_WHITESPACE = re.compile(r"\s*")
+
+# Running totals, read by the metrics endpoint.
+stats = {"parsed": 0, "recovered": 0, "failed": 0, "invalid_items": 0}
+
+
+def _count(outcome: str):
+    stats[outcome] += 1
+    metrics.json_parse_total.inc(route=metrics.current_route.get(),
+                                 outcome=outcome)
+
+
+class StructuredOutputError(json.JSONDecodeError):
+    pass
+
+
+def _cut_off(text: str, value, pos: int, closer: str) -> bool:
+    # A number or literal running into the end of the text may be the start
+    # of a longer one ("1" of "12"), so it only counts once a delimiter
+    # follows. Strings, arrays and objects end in their own closing mark.
+    if isinstance(value, (str, list, dict)):
+        return False
+    return pos >= len(text) or text[pos] not in "," + closer
+
+
+def _recover_array(text: str, start: int) -> list:
+    # Decode a (possibly truncated) array element by element, keeping every
+    # element that was complete before the text ran out or went bad.
+    items = []
+    pos = _WHITESPACE.match(text, start + 1).end()
+    while pos < len(text) and text[pos] != "]":
+        try:
+            value, pos = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break
+        pos = _WHITESPACE.match(text, pos).end()
+        if _cut_off(text, value, pos, "]"):
+            break
+        items.append(value)
+        if pos < len(text) and text[pos] == ",":
+            pos = _WHITESPACE.match(text, pos + 1).end()
+    return items
+
+
+def _recover_object(text: str, start: int) -> dict:
+    # Same idea for a truncated object: keep the complete key/value pairs.
+    value = {}
+    pos = _WHITESPACE.match(text, start + 1).end()
+    while pos < len(text) and text[pos] == '"':
+        try:
+            key, pos = _decoder.raw_decode(text, pos)
+            pos = _WHITESPACE.match(text, pos).end()
+            if pos >= len(text) or text[pos] != ":":
+                break
+            pos = _WHITESPACE.match(text, pos + 1).end()
+            member, pos = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break
+        pos = _WHITESPACE.match(text, pos).end()
+        if _cut_off(text, member, pos, "}"):
+            break
+        value[key] = member
+        if pos < len(text) and text[pos] == ",":
+            pos = _WHITESPACE.match(text, pos + 1).end()
+    return value
+
+
+def extract_json(text: str, expect=None):
+    """Return the first well-formed JSON value in a model's output.
+
+    Preambles, code fences and trailing prose are skipped. If the value is
+    cut off, its complete array elements or object members are returned.
+    `expect` (list or dict) restricts which kind of value is accepted.
+    """
+    text = text or ""
+    for match in _START.finditer(text):
+        start = match.start()
+        opener = text[start]
+        if expect is list and opener != "[":
+            continue
+        if expect is dict and opener != "{":
+            continue
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            recover = _recover_array if opener == "[" else _recover_object
+            value = recover(text, start)
+            if value:
+                _count("recovered")
+                return value
+            continue
+        _count("parsed")
+        return value
+    _count("failed")
+    raise StructuredOutputError("No JSON value in model output", text, 0)
+
+
+def _normalize_keys(value):
+    # Models drift between "first message" and "first_message"
+    if isinstance(value, dict):
+        return {
+            str(key).strip().replace(" ", "_"): item
+            for key, item in value.items()
+        }
+    return value
+
+
+def parse_list(text: str, model: type[BaseModel] = None) -> list:
+    """Extract a JSON array and validate each element against `model`.
+
+    Elements that fail validation are dropped rather than failing the
+    whole response.
+    """
+    values = extract_json(text, expect=list)
+    if model is None:
+        return values
+    items = []
+    for value in values:
+        try:
+            items.append(model(**_normalize_keys(value)))
+        except (TypeError, ValidationError):
+            _count("invalid_items")
+    return items
+
+
+def parse_object(text: str, model: type[BaseModel] = None):
+    value = _normalize_keys(extract_json(text, expect=dict))
+    if model is None:
+        return value
+    try:
+        return model(**value)
+    except ValidationError as e:
+        _count("failed")
+        raise StructuredOutputError(f"Model output failed validation: {e}",
+                                    text, 0)
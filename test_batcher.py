@@ -0,0 +1,74 @@
+import asyncio
+
+from batcher import MicroBatcher
+
+
+def _batcher(window=0.01, token_budget=100, fail_batch=False, skip=()):
+    calls = {"batch": [], "one": []}
+
+    async def run_batch(key, payloads):
+        calls["batch"].append(list(payloads))
+        if fail_batch:
+            raise RuntimeError("bad batch")
+        return [None if p in skip else f"{key}:{p}" for p in payloads]
+
+    async def run_one(key, payload):
+        calls["one"].append(payload)
+        return f"{key}:{payload}!"
+
+    return MicroBatcher(run_batch, run_one, window, token_budget), calls
+
+
+def test_submissions_in_window_share_a_batch_per_key():
+
+    async def run():
+        batcher, calls = _batcher()
+        results = await asyncio.gather(batcher.submit("a", 1, 10),
+                                       batcher.submit("a", 2, 10),
+                                       batcher.submit("b", 3, 10))
+        return results, calls
+
+    results, calls = asyncio.run(run())
+    assert results == ["a:1", "a:2", "b:3!"]
+    assert calls == {"batch": [[1, 2]], "one": [3]}
+
+
+def test_token_budget_flushes_early():
+
+    async def run():
+        batcher, calls = _batcher(window=10, token_budget=20)
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.submit("a", 1, 10),
+                           batcher.submit("a", 2, 10)), 1)
+        return results, calls
+
+    results, calls = asyncio.run(run())
+    assert results == ["a:1", "a:2"]
+    assert calls["batch"] == [[1, 2]]
+
+
+def test_missing_and_failed_results_fail_over_to_run_one():
+
+    async def run(**options):
+        batcher, calls = _batcher(**options)
+        results = await asyncio.gather(batcher.submit("a", 1, 10),
+                                       batcher.submit("a", 2, 10))
+        return results, calls, batcher.failovers
+
+    results, calls, failovers = asyncio.run(run(skip=(2, )))
+    assert results == ["a:1", "a:2!"] and calls["one"] == [2]
+    assert failovers == 1
+
+    results, calls, failovers = asyncio.run(run(fail_batch=True))
+    assert results == ["a:1!", "a:2!"] and failovers == 2
+
+
+def test_zero_window_disables_batching():
+
+    async def run():
+        batcher, calls = _batcher(window=0)
+        await asyncio.gather(batcher.submit("a", 1, 10),
+                             batcher.submit("a", 2, 10))
+        return calls
+
+    assert asyncio.run(run()) == {"batch": [], "one": [1, 2]}
@@ -0,0 +1,82 @@
+import pytest
+
+import fastpath
+
+GOAL = "I want it for $100"
+# Above the goal, so refusals can end the chat
+CONTEXT = "The seller is selling a blue couch, listed at $150"
+
+
+@pytest.mark.parametrize("message, last_offer, rule", [
+    ("$80", "", "accept_below_goal"),
+    ("$100!", "", "accept_below_goal"),
+    ("$80 works", "", "accept_below_goal"),
+    ("I can do $80", "", "accept_below_goal"),
+    ("Ok, I can do 90 bucks.", "", "accept_below_goal"),
+    ("Would you take $95?", "", "accept_below_goal"),
+    ("yes", "Would you take $85?", "accept_our_offer"),
+    ("Sure, that works", "Would you take $85?", "accept_our_offer"),
+    ("$150, price is firm", "", "firm_above_goal"),
+    ("no", "", "hard_refusal"),
+    ("Price is firm, sorry", "", "hard_refusal"),
+    ("Yes it's still available", "", "still_available"),
+])
+def test_fast_path_answers(message, last_offer, rule):
+    response = fastpath.reply(message, GOAL, last_offer, CONTEXT)
+    assert response is not None
+    assert response["reasoning"].startswith(f"Fast path ({rule})")
+
+
+@pytest.mark.parametrize("message, last_offer", [
+    ("I can knock $10 off", ""),
+    ("Delivery is $20 extra", ""),
+    ("I already sold it for $50", ""),
+    ("price is firm at $90", ""),
+    ("I paid $300 for it, price is firm", ""),
+    ("$80 plus $15 shipping", ""),
+    ("$80 or $120 with the stand", ""),
+    ("I'd want at least $80, it's in great shape", ""),
+    ("No, $80 is too low", ""),
+    ("$150", ""),
+    ("yes", "Would you take $85 or $90 with delivery?"),
+    ("yes", "Would you take $120?"),
+    ("yes", "What condition is it in?"),
+])
+def test_fast_path_leaves_to_llm(message, last_offer):
+    assert fastpath.reply(message, GOAL, last_offer, CONTEXT) is None
+
+
+@pytest.mark.parametrize("message, users_goal, context", [
+    ("Price is firm, sorry", "I want to buy blue couch for $200",
+     "The seller is selling a blue couch, listed at $100"),
+    ("no lowballs", "I want to buy blue couch for $200",
+     "The seller is selling a blue couch, listed at $200"),
+    ("no", "I want to buy blue couch for $100", "Blue couch, good condition"),
+    ("not negotiable", "I want to buy blue couch for $100",
+     "Blue couch $150, or $120 without the cushions"),
+    ("$150, price is firm", "I want a blue couch", CONTEXT),
+])
+def test_refusal_within_budget_goes_to_llm(message, users_goal, context):
+    assert fastpath.reply(message, users_goal, "", context) is None
+
+
+@pytest.mark.parametrize("context, price", [
+    ("The seller is selling a couch (was $300), listed at $150", 150),
+    ("Blue couch $120", 120),
+    ("Blue couch $150, or $120 without the cushions", None),
+    ("Blue couch", None),
+])
+def test_listed_price(context, price):
+    assert fastpath.listed_price(context) == price
+
+
+@pytest.mark.parametrize("message, last_offer, goal, price", [
+    ("I can do $80", "", 100, 80),
+    ("yes", "How about $85?", 100, 85),
+    ("$120", "", 100, None),
+    ("I can knock $10 off", "How about $85?", 100, None),
+    ("sounds good", "Would you do $70 or $75?", 100, None),
+    ("$120", "", None, 120),
+])
+def test_agreed_price(message, last_offer, goal, price):
+    assert fastpath.agreed_price(message, last_offer, goal) == price
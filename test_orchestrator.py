@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from fastpath import ACCEPT_MESSAGE
+from orchestrator import Orchestrator
+
+
+async def _accept(session, message):
+    # Stands in for a model that says yes to anything
+    return {"role": "assistant", "content": ACCEPT_MESSAGE}, True
+
+
+async def _negotiate(message: str, last_offer: str):
+    negotiations = Orchestrator(_accept)
+    search = negotiations.start(1, "I want it for $100", [
+        {"item_id": "a", "context": "couch", "message": last_offer},
+        {"item_id": "b", "context": "couch"},
+    ])
+    search.receive("a", message)
+    for _ in range(10):
+        await asyncio.sleep(0)
+    statuses = {s.item_id: s.status for s in search.sellers.values()}
+    await negotiations.close()
+    return search.deal, statuses
+
+
+@pytest.mark.parametrize("message, last_offer, price", [
+    ("$80", "Would you take $70?", 80),
+    ("I can do $90", "Would you take $70?", 90),
+    ("yes", "Would you take $85?", 85),
+])
+def test_explicit_agreement_closes_the_deal(message, last_offer, price):
+    deal, statuses = asyncio.run(_negotiate(message, last_offer))
+    assert deal == {"item_id": "a", "price": price}
+    assert statuses == {"a": "deal", "b": "stopped"}
+
+
+@pytest.mark.parametrize("message, last_offer", [
+    ("I can knock $10 off", "Would you take $70?"),
+    ("Delivery is $20 extra", "Would you take $70?"),
+    ("$80 or $90 with the stand", "Would you take $70?"),
+    ("yes", "Would you take $85 or $90 with delivery?"),
+    ("sounds great, see you tomorrow", "Would you take $85?"),
+])
+def test_unconfirmed_total_keeps_other_sellers_open(message, last_offer):
+    deal, statuses = asyncio.run(_negotiate(message, last_offer))
+    assert deal is None
+    assert statuses == {"a": "accepted", "b": "open"}
@@ -0,0 +1,27 @@
+from prefilter import prefilter
+
+LISTINGS = [
+    {"description": "Blue couch, good condition", "url": "a", "price": 90},
+    {"description": "IKEA loveseat", "url": "b", "price": 80},
+    {"description": "Grey sofa bed", "url": "c", "price": 95},
+    {"description": "Leather sofa", "url": "d", "price": 400},
+]
+
+
+def test_listings_without_shared_terms_reach_the_model():
+    kept, report = prefilter("looking for a sofa under $100", LISTINGS[:2])
+    assert [item["url"] for item in kept] == ["a", "b"]
+    assert report["irrelevant"] == 0
+
+
+def test_matches_first_then_price_window_and_top_n():
+    kept, report = prefilter("grey sofa", LISTINGS, maxprice=100, top_n=2)
+    assert [item["url"] for item in kept] == ["c", "a"]
+    assert report["price_window"] == 1
+    assert report["top_n"] == 1
+
+
+def test_zero_scores_dropped_when_asked():
+    kept, report = prefilter("sofa", LISTINGS[:3], min_score=0)
+    assert [item["url"] for item in kept] == ["c"]
+    assert report["irrelevant"] == 2
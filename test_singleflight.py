@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_task():
+
+    async def run():
+        flight, calls = SingleFlight(), []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*(flight.do("k", work)
+                                         for _ in range(5)))
+        again = await flight.do("k", work)
+        return results, again, calls, flight.stats()
+
+    results, again, calls, stats = asyncio.run(run())
+    assert results == ["done"] * 5 and again == "done"
+    assert len(calls) == 2
+    assert stats == {"in_flight": 0, "started": 2, "coalesced": 4,
+                     "cancelled": 0}
+
+
+def test_exception_reaches_every_waiter():
+
+    async def run():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(run()))
+
+
+def test_task_cancelled_only_when_every_waiter_leaves():
+
+    async def run():
+        flight, started = SingleFlight(), asyncio.Event()
+        finished = []
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            finished.append(1)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("k", work))
+        second = asyncio.ensure_future(flight.do("k", work))
+        await started.wait()
+        first.cancel()
+        assert await second == "done"
+
+        third = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        third.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await third
+        await asyncio.sleep(0.06)
+        return finished, flight.stats()
+
+    finished, stats = asyncio.run(run())
+    assert finished == [1]
+    assert stats["cancelled"] == 1 and stats["in_flight"] == 0
@@ -0,0 +1,38 @@
+import pytest
+
+from streaming import ContentFieldParser
+
+
+def _feed(deltas):
+    parser = ContentFieldParser()
+    return parser, [parser.feed(delta) for delta in deltas]
+
+
+@pytest.mark.parametrize("deltas, content", [
+    (['{"role": "assistant", "content": "Hi there"}'], "Hi there"),
+    (['{"reasoning": "be nice, say \\"hi\\"", ', '"content": "ok"}'], "ok"),
+    (['```json\n{"message": "Would you ', 'take $80?", "x": 1}'],
+     "Would you take $80?"),
+    (['{"content": "a\\', 'nb\\', '"c\\u00', 'e9 \\\\"}'], 'a\nb"cé \\'),
+    (['{"con', 'tent"', ': "', 'split', '"}'], "split"),
+])
+def test_content_field_parser(deltas, content):
+    parser, chunks = _feed(deltas)
+    assert "".join(chunks) == parser.content == content
+    assert parser.done
+
+
+def test_escape_split_across_deltas_is_held_back():
+    parser = ContentFieldParser()
+    assert parser.feed('{"content": "line\\') == "line"
+    assert parser.feed("n") == "\n"
+    assert parser.feed('\\u00') == ""
+    assert parser.feed('e9"') == "é"
+    assert parser.feed(', "reasoning": "ignored"}') == ""
+
+
+def test_no_content_field():
+    parser, chunks = _feed(['{"reasoning": "x", ', '"relevant": 1}'])
+    assert chunks == ["", ""]
+    assert not parser.done
+    assert parser.buffer == '{"reasoning": "x", "relevant": 1}'
@@ -0,0 +1,64 @@
+import pytest
+from pydantic import BaseModel
+
+import compact
+from structured_output import (StructuredOutputError, extract_json,
+                               parse_list, parse_object)
+
+
+class Verdict(BaseModel):
+    item_id: str
+    relevant: int
+
+
+@pytest.mark.parametrize("text, expect, value", [
+    ('Sure! Here are the results: [1, 2, 3] Hope that helps.', list,
+     [1, 2, 3]),
+    ('```json\n{"relevant": 1}\n```', dict, {"relevant": 1}),
+    ('Note {not json} then {"a": [1, {"b": 2}]}', dict, {"a": [1, {"b": 2}]}),
+    ('[{"a": 1}, {"b": 2}, {"c"', list, [{"a": 1}, {"b": 2}]),
+    ('[3, 1, 12, ', list, [3, 1, 12]),
+    ('[3, 1, 1', list, [3, 1]),
+    ('[3, 1, 1 ]x', list, [3, 1, 1]),
+    ('["a", "b", "c', list, ["a", "b"]),
+    ('[true, null, fals', list, [True, None]),
+    ('[true, null', list, [True]),
+    ('{"item_id": "a", "relevant": 1', dict, {"item_id": "a"}),
+    ('{"item_id": "a", "relevant": 1,', dict, {"item_id": "a", "relevant": 1}),
+    ('{"reasoning": "fine", "tags": ["x"', dict, {"reasoning": "fine"}),
+])
+def test_extract_json(text, expect, value):
+    assert extract_json(text, expect=expect) == value
+
+
+@pytest.mark.parametrize("text, expect", [
+    ("", None),
+    ("no json here", None),
+    ('{"a": 1}', list),
+    ("[", list),
+])
+def test_extract_json_fails(text, expect):
+    with pytest.raises(StructuredOutputError):
+        extract_json(text, expect=expect)
+
+
+def test_parse_list_drops_invalid_items():
+    text = ('[{"item id": "a", "relevant": 1}, {"item_id": "b"}, '
+            '{"item_id": "c", "relevant": 0}, {"item_id": "d", "relevant": 1')
+    assert parse_list(text, Verdict) == [
+        Verdict(item_id="a", relevant=1),
+        Verdict(item_id="c", relevant=0)
+    ]
+
+
+def test_parse_object_validates():
+    assert parse_object('```{"item_id": "a", "relevant": "1"}```',
+                        Verdict) == Verdict(item_id="a", relevant=1)
+    with pytest.raises(StructuredOutputError):
+        parse_object('{"item_id": "a"}', Verdict)
+
+
+def test_parse_rank_ignores_a_cut_off_id():
+    items = [{"url": f"u{i}"} for i in range(1, 13)]
+    assert compact.parse_rank("[3, 1, 1", items) == ["u3", "u1"]
+    assert compact.parse_rank("[3, 1, 12]", items) == ["u3", "u1", "u12"]